@@ -5,23 +5,47 @@
 # September 15, 2021
 
 from inc_noesis import *
-from collections import namedtuple
-from ctypes import cdll, c_char_p, c_int64, c_long, create_string_buffer
+from collections import namedtuple, OrderedDict
+from bisect import bisect_left
+from operator import itemgetter
+from ctypes import cdll, c_char, c_char_p, c_int64, c_long, c_void_p
+import threading
+import zlib
+import time
+import hashlib
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 import re
 import math
 import os
 import copy
 from shutil import copyfile
+try:
+	import numpy as np #optional, used to decode vertex streams in bulk
+except ImportError:
+	np = None
 
+pluginVersion = "1.6a" #part of the mesh cache key, so cached meshes are decoded again after an update
 
 #									Location of Oodle DLL (will check next to this py file if not found):
 dllLocation  = 						"C:\\GOG\\Cyberpunk 2077\\bin\x64\\oo2ext_7_win64.dll"
+#									Compression backend: "oodle" (the DLL above, or liboo2corelinux64.so on Linux), "standin" (deterministic zlib stand-in for headless testing, NOT readable by the game), or leave it blank to auto-detect Oodle:
+compressionBackend = 				""
 #									Set this to your folder containing basegame_4_gamedata and basegame_3_nightcity, or leave it blank to auto-detect:
 extractedDir = 						""
 
 #Mesh options:
 meshScale = 100						#scale model to this size
 bCompress = True					#If put to true, the model data will be compressed and decompressed with the Oodle DLL
+bParallelDecompress = False			#if put to True, all compressed buffers of a file are decompressed at once in a thread pool when it is opened
+bCompressionCache = False			#if put to True, compressed buffers are cached on disk by content, so buffers that did not change since the last export are not compressed again
+compressionCacheMB = 512				#size limit of the compressed buffer cache, the least recently used buffers are removed first
+compressionProfile = "ship"			#compression of exported buffers: "fast iteration" (quickest export, larger files), "balanced" or "ship" (smallest files, like the game's). Can be overridden with the -cp77compression export option
+bMeshCache = False					#if put to True, decoded meshes are cached on disk next to CP77ExtractedPath.txt, so re-importing an unchanged file with the same options skips decoding it
+meshCacheMB = 1024					#size limit of the decoded mesh cache, the least recently used meshes are removed first
+rigCacheCount = 8					#number of parsed rig files kept in memory between imports, so base rigs shared by many meshes are only read once. Put to 0 to disable it
+bRigDiskCache = False				#if put to True, parsed rig files are also cached on disk next to CP77ExtractedPath.txt, keyed by rig path and modification time
+rigCacheMB = 64						#size limit of the parsed rig disk cache, the least recently used rigs are removed first
 bHighestLODOnly = True   	  		#if put to True, the low poly meshes will be loaded as separate models
 bLoadRigFile = False 	       		#if put to True, enables user-selection of a paired rig file with the skeleton hierarchy info
 bAutoDetectRig = True				#if put to True, the plugin will search for and load the closest-named .rig file to the mesh filename
@@ -30,6 +54,7 @@ bReadTangents = False				#if put to True, tangents are read from the file and ap
 bImportGarmentMesh = False			#if put to True, garment meshes will be imported along with the regular mesh
 bImportExportDamageMeshes = True	#if put to True, vehicle damage meshes will be imported along with the regular mesh, and will be exported if they are detected in the fbx
 bImportMorphtargets	= False			#if put to True, morphs will be imported with morphtarget files (currently broken)**
+morphTargetFilter = ""				#morph targets to import from morphtarget files, as indices, index ranges and/or names, e.g. "1-20,45,jaw_open". Leave it blank to import all of them. Can be overridden with the -cp77morphs import option
 bVertexColors	= True				#if put to True, vertex colors will be read and applied to the model on import, and will be written on export
 bExportAllBuffers = True			#if put to True, all buffers will be exported when saving meshes or textures, rather than just the ones modified
 bConnectRigToRoot = False			#if put to True, rigs will be assembled in such a way that a connection is always made to the Noesis_Root bone
@@ -39,16 +64,6 @@ bManualDimensions = False			#if put to True, the user can set their own texture
 bManualCompression = False			#if put to True, the user can set their own texture compression on import	
 bReadAsSigned = True				#if put to True, textures will be decoded as signed data, making normal maps yellow instead of blue
 
-try:
-	lib = cdll.LoadLibrary(dllLocation)
-except:
-	try:
-		dllLocation = noesis.getPluginsPath() + 'python\\oo2ext_7_win64.dll'
-		lib = cdll.LoadLibrary(dllLocation) #look for Oodle DLL in Noesis plugins folder
-	except:
-		print ("Could not load Oodle DLL! Cyberpunk 2077 Compression is disabled")
-		bCompress = False
-
 def registerNoesisTypes():
 	handle = noesis.register("CyberPunk 2077 mesh [PC]",".mesh;.cookedapp")
 	noesis.setHandlerTypeCheck(handle, checkType)
@@ -60,28 +75,34 @@ def registerNoesisTypes():
 	noesis.addOption(handle, "-bones", "Create copy of picked mesh with skeleton from FBX", 0)
 	noesis.addOption(handle, "-meshbones", "Writes new mesh with skeleton from FBX", 0)
 	noesis.addOption(handle, "-meshfile", "Set mesh file to export over", noesis.OPTFLAG_WANTARG)
+	noesis.addOption(handle, "-cp77compression", "Compression profile for exported buffers: fast, balanced or ship", noesis.OPTFLAG_WANTARG)
 	handle = noesis.register("CyberPunk 2077 mesh [PC]",".morphtarget")
 	noesis.setHandlerTypeCheck(handle, checkType)
 	noesis.setHandlerLoadModel(handle, LoadModel)	
 	noesis.setHandlerWriteModel(handle, meshWriteModel)
 	noesis.setTypeExportOptions(handle, "-noanims")
 	noesis.addOption(handle, "-cp77optimize", "Optimizes vertices and faces on morphtarget import", 0)
+	noesis.addOption(handle, "-cp77morphs", "Morph targets to import, as indices, index ranges and/or names: 1-20,45,jaw_open", noesis.OPTFLAG_WANTARG)
 	noesis.addOption(handle, "-rig", "Exports new .rig file based on bones from your FBX", 0)
 	noesis.addOption(handle, "-bones", "Create copy of picked mesh with skeleton from FBX", 0)
 	noesis.addOption(handle, "-meshbones", "Writes new mesh with skeleton from FBX", 0)
 	noesis.addOption(handle, "-meshfile", "Set mesh file to export over", noesis.OPTFLAG_WANTARG)
+	noesis.addOption(handle, "-cp77compression", "Compression profile for exported buffers: fast, balanced or ship", noesis.OPTFLAG_WANTARG)
 	noesis.addOption(handle, "-vf", "Saves morphtarget meshes using a specific vertex factory", noesis.OPTFLAG_WANTARG)
 	handle = noesis.register("CyberPunk 2077 Texture [PC]", ".xbm;.mi;.cp77tex")
 	noesis.setHandlerTypeCheck(handle, checkType)
 	noesis.setHandlerLoadRGBA(handle, xbmLoadDDS)
 	handle = noesis.register("CyberPunk 2077 Texture [PC]", ".cp77tex")
 	noesis.addOption(handle, "-texfile", "Set CP77tex file to export over", noesis.OPTFLAG_WANTARG)
+	noesis.addOption(handle, "-cp77compression", "Compression profile for exported buffers: fast, balanced or ship", noesis.OPTFLAG_WANTARG)
 	noesis.setHandlerWriteRGBA(handle, xbmWriteRGBA)
 	handle = noesis.register("CyberPunk 2077 Texture [PC]", ".mi")
 	noesis.addOption(handle, "-texfile", "Set mi file to export over", noesis.OPTFLAG_WANTARG)
+	noesis.addOption(handle, "-cp77compression", "Compression profile for exported buffers: fast, balanced or ship", noesis.OPTFLAG_WANTARG)
 	noesis.setHandlerWriteRGBA(handle, xbmWriteRGBA)
 	handle = noesis.register("CyberPunk 2077 Texture [PC]", ".xbm")
 	noesis.addOption(handle, "-texfile", "Set xbm file to export over", noesis.OPTFLAG_WANTARG)
+	noesis.addOption(handle, "-cp77compression", "Compression profile for exported buffers: fast, balanced or ship", noesis.OPTFLAG_WANTARG)
 	noesis.setHandlerWriteRGBA(handle, xbmWriteRGBA)
 	return 1
 
@@ -130,6 +151,313 @@ def writeUIntAt(bs, offset, value):
 def magnitude(vector):  
     return math.sqrt(sum(pow(element, 2) for element in vector)) 
 
+def dequantizePositions(buffer, vc, stride, qScale, qOff):
+	#unpacks vc int16 XYZ positions at the start of every stride-sized vertex and returns them as packed floats:
+	if np is not None:
+		shorts = np.ndarray((vc, 3), dtype='<i2', buffer=buffer, strides=(stride, 2))
+		posArray = (shorts / 32767.0 * np.array(qScale[:3]) + np.array(qOff[:3])) * meshScale
+		return posArray.astype('<f4').tobytes()
+	posList = []
+	for v in range(vc):
+		idx = stride * v
+		vx  = (float((struct.unpack_from('h', buffer, idx))[0]) / 32767.0)
+		vy  = (float((struct.unpack_from('h', buffer, idx + 2))[0]) / 32767.0)
+		vz  = (float((struct.unpack_from('h', buffer, idx + 4))[0]) / 32767.0)
+		posList.append((vx * qScale[0] + qOff[0]) * meshScale) 
+		posList.append((vy * qScale[1] + qOff[1]) * meshScale)
+		posList.append((vz * qScale[2] + qOff[2]) * meshScale)
+	return struct.pack("<" + 'f'*len(posList), *posList)
+
+def getVectorArray(vectors, width=3):
+	#the first width components of a list of Noe vectors as an (n, width) float64 array, or as a list of tuples without NumPy:
+	getter = itemgetter(*range(width))
+	rows = [getter(vec) for vec in vectors]
+	if np is not None:
+		return np.array(rows, dtype=np.float64).reshape(-1, width)
+	return rows
+
+class SubmeshArrays:
+	#contiguous per-attribute arrays of one exported submesh, converted from its NoeMesh once so the vertex streams are written without going through per-vertex Noe objects
+	__slots__ = ("name", "sourceName", "vertexCount", "positions", "normals", "tangents", "uvs", "lmUVs", "colors", "boneIndices", "boneWeights", "indices")
+	
+	def __init__(self, mesh):
+		self.name = mesh.name
+		self.sourceName = mesh.sourceName
+		self.vertexCount = len(mesh.positions)
+		self.positions = getVectorArray(mesh.positions)
+		self.normals = getVectorArray([tangent[0] for tangent in mesh.tangents])
+		self.tangents = getVectorArray([tangent[2] for tangent in mesh.tangents])
+		self.uvs = getVectorArray(mesh.uvs, 2)
+		self.lmUVs = getVectorArray(mesh.lmUVs, 2)
+		self.colors = getVectorArray(mesh.colors, 4)
+		#influence counts vary per vertex, so these are kept as one tuple per vertex:
+		self.boneIndices = [tuple(weight.indices) for weight in mesh.weights]
+		self.boneWeights = [tuple(weight.weights) for weight in mesh.weights]
+		self.indices = np.array(mesh.indices, dtype=np.int64) if np is not None else tuple(mesh.indices)
+		
+	def append(self, pieces):
+		#appends the vertices and faces of other SubmeshArrays, with every attribute concatenated once and their indices rebased in bulk
+		pieces = [self] + pieces
+		offsets = [0]
+		for piece in pieces[:-1]:
+			offsets.append(offsets[-1] + piece.vertexCount)
+		for attribute in ("positions", "normals", "tangents", "uvs", "lmUVs"):
+			setattr(self, attribute, joinArrays([getattr(piece, attribute) for piece in pieces]))
+		self.colors = joinArrays([padArray(piece.colors, piece.vertexCount, 4) for piece in pieces])
+		self.boneIndices = [influences for piece in pieces for influences in piece.boneIndices]
+		self.boneWeights = [influences for piece in pieces for influences in piece.boneWeights]
+		if np is not None:
+			self.indices = np.concatenate([piece.indices + offset for piece, offset in zip(pieces, offsets)])
+		else:
+			self.indices = tuple(index + offset for piece, offset in zip(pieces, offsets) for index in piece.indices)
+		self.vertexCount = offsets[-1] + pieces[-1].vertexCount
+
+def joinArrays(arrays):
+	if np is not None:
+		return np.concatenate(arrays)
+	return [row for array in arrays for row in array]
+
+def padArray(array, count, width):
+	#the first count rows of array, padded with rows of zeros
+	if len(array) >= count:
+		return array[:count]
+	if np is not None:
+		return np.concatenate((array, np.zeros((count - len(array), width))))
+	return list(array) + [(0.0,) * width] * (count - len(array))
+
+def mergeSplitMeshes(meshes):
+	#merges the pieces Noesis split meshes into ("0000_submesh0", "0001_submesh0"...) back into one mesh per source mesh, in linear time
+	groups = {}
+	counts = {}
+	for mesh in meshes:
+		mesh.name = mesh.name[5:]
+		key = (mesh.sourceName, mesh.name)
+		if key not in groups:
+			groups[key] = [mesh]
+			counts[key] = [mesh.vertexCount, len(mesh.indices)]
+		elif counts[key] == [mesh.vertexCount, len(mesh.indices)]: #ignore real duplicates
+			continue
+		else:
+			groups[key].append(mesh)
+			counts[key][0] += mesh.vertexCount
+			counts[key][1] += len(mesh.indices)
+	for group in groups.values():
+		if len(group) > 1:
+			group[0].append(group[1:])
+	return [group[0] for group in groups.values()]
+
+def indexSubmeshNames(meshes):
+	#maps (submesh index, role) to the meshes the writer uses, parsing each name once: role "base" for names read as "submeshN" (the number after "submesh", as before) and role "damageMesh" for names that are exactly "submeshN_damageMesh"
+	found = {}
+	malformed = []
+	for mesh in meshes:
+		key = None
+		match = re.fullmatch(r'submesh(0|[1-9][0-9]*)_damageMesh', mesh.name)
+		if match:
+			key = (int(match.group(1)), "damageMesh")
+		else:
+			try:
+				key = (int(mesh.name.split('submesh')[1]), "base")
+			except (IndexError, ValueError):
+				pass
+		if key is None:
+			malformed.append(mesh.name)
+		elif key in found:
+			found[key].append(mesh)
+		else:
+			found[key] = [mesh]
+	if malformed:
+		print ("WARNING: The following meshes are not named \"submeshN\" or \"submeshN_damageMesh\" and were ignored:\n    " + ", ".join(malformed))
+	return found
+
+bNumpyHalfFloats = None
+
+def numpyHalfFloatsMatch():
+	#checks once whether NumPy's float16 conversion writes the same bytes as writeHalfFloat, on the midpoints between neighbouring half floats (and just either side of them) across the whole range, subnormals, signed zeros and infinities
+	global bNumpyHalfFloats
+	if bNumpyHalfFloats is None:
+		bNumpyHalfFloats = False
+		if np is not None:
+			halves = np.arange(0, 0x7C00, 7, dtype=np.uint16).view(np.float16).astype(np.float64)
+			mids = (halves[:-1] + halves[1:]) / 2
+			probe = np.concatenate((halves, mids, np.nextafter(mids, 0), np.nextafter(mids, np.inf), [65504.0, 65519.99, -0.0, np.inf]))
+			probe = np.concatenate((probe, -probe))
+			bs = NoeBitStream()
+			try:
+				for value in probe.tolist():
+					bs.writeHalfFloat(value)
+			except Exception:
+				return False
+			bNumpyHalfFloats = bs.getBuffer() == probe.astype('<f2').tobytes()
+	return bNumpyHalfFloats
+
+def packUVs(uvs, colors=None):
+	#encodes UV rows as half floats (flipped back if bFlipImage), each preceded by its RGBA8 color if colors are given, or by 0 for vertices without one. NumPy converts the half floats in bulk when it matches writeHalfFloat and every value is in float16 range, otherwise they go through writeHalfFloat one by one:
+	colorBytes = None
+	if colors is not None:
+		if np is not None and len(colors):
+			colorBytes = ((np.asarray(colors, dtype=np.float64).reshape(-1, 4) * 255.0).astype(np.int64) & 255).astype(np.uint8).tobytes()
+		else:
+			colorBytes = bytes(int(channel * 255.0) & 255 for color in colors for channel in color)
+		colorBytes += bytes(max(0, len(uvs) - len(colors)) * 4)
+	if np is not None and len(uvs) and numpyHalfFloatsMatch():
+		uvArray = np.array([(uv[0], uv[1]) for uv in uvs], dtype=np.float64)
+		if bFlipImage:
+			uvArray[:, 1] = 1 - uvArray[:, 1]
+		if np.all(np.abs(uvArray) <= 65504.0):
+			if colorBytes is None:
+				return uvArray.astype('<f2').tobytes()
+			records = np.empty(len(uvArray), dtype=[('color', 'u1', 4), ('uv', '<f2', 2)])
+			records['color'] = np.frombuffer(colorBytes, dtype=np.uint8, count=len(uvArray) * 4).reshape(-1, 4)
+			records['uv'] = uvArray
+			return records.tobytes()
+	bs = NoeBitStream()
+	for v, uv in enumerate(uvs):
+		if colorBytes is not None:
+			bs.writeBytes(colorBytes[v*4:v*4+4])
+		bs.writeHalfFloat(uv[0])
+		bs.writeHalfFloat(1-uv[1] if bFlipImage else uv[1])
+	return bs.getBuffer()
+
+def quantizePositions(positions, qScale, qOff, stride=8):
+	#encodes positions (rows of XYZ) as int16 "-X Z Y 32767" at the start of every stride-sized vertex of a new bytearray, or returns None if a value does not fit an int16:
+	vertBuff = bytearray(len(positions) * stride)
+	if np is not None and len(positions):
+		posArray = np.asarray(positions, dtype=np.float64).reshape(-1, 3) * (1 / meshScale)
+		shorts = np.empty((len(positions), 4), dtype=np.float64)
+		shorts[:,0] = -np.trunc((posArray[:,0] - qOff[0]) / qScale[0] * 32767.0)
+		shorts[:,1] = np.trunc((posArray[:,2] - qOff[2]) / qScale[2] * 32767.0)
+		shorts[:,2] = np.trunc((posArray[:,1] - qOff[1]) / qScale[1] * 32767.0)
+		shorts[:,3] = 32767
+		if not np.all((shorts >= -32768) & (shorts <= 32767)):
+			return None
+		vertArray = np.frombuffer(vertBuff, dtype=np.uint8).reshape(len(positions), stride)
+		vertArray[:,:8] = shorts.astype('<i2').view(np.uint8)
+		return vertBuff
+	for v, vert in enumerate(positions):
+		valueA =  (int((vert[0] * (1 / meshScale) - qOff[0]) / qScale[0] * 32767.0))
+		valueB =  (int((vert[2] * (1 / meshScale) - qOff[2]) / qScale[2] * 32767.0))
+		valueC =  (int((vert[1] * (1 / meshScale) - qOff[1]) / qScale[1] * 32767.0))
+		try:
+			struct.pack_into("<hhhh", vertBuff, v * stride, -valueA, valueB, valueC, 32767)
+		except struct.error:
+			return None
+	return vertBuff
+
+def pack101010(vectors, wBits=0):
+	#encodes XYZ vectors as packed 10:10:10:2 ints in the game's "-X Z Y" order, returned as an int32 array (or list without NumPy):
+	if np is not None:
+		vecArray = vectors if isinstance(vectors, np.ndarray) else np.array([(vec[0], vec[1], vec[2]) for vec in vectors], dtype=np.float64).reshape(-1, 3)
+		packed = np.trunc(-(vecArray[:,0] * 512.0) + 511.0000001).astype(np.int64)
+		packed |= np.trunc((vecArray[:,2] * 512.0) + 511.0000001).astype(np.int64) << 10
+		packed |= np.trunc((vecArray[:,1] * 512.0) + 511.0000001).astype(np.int64) << 20
+		return (packed | wBits).astype('<i4')
+	return [wBits | int(-(vec[0] * 512.0) + 511.0000001) | int((vec[2] * 512.0) + 511.0000001) << 10 | int((vec[1] * 512.0) + 511.0000001) << 20 for vec in vectors]
+
+def packReversedTriangles(indices):
+	#packs a triangle list as uint16 with the winding order of every triangle reversed, dropping an incomplete last triangle:
+	triCount = len(indices) // 3
+	if np is not None:
+		triArray = np.asarray(indices[:triCount * 3], dtype=np.int64).reshape(-1, 3)[:,::-1]
+		if triArray.size and (triArray.min() < 0 or triArray.max() > 65535):
+			raise ValueError("Face index out of the 16-bit range: " + str(triArray.max() if triArray.max() > 65535 else triArray.min()))
+		return triArray.astype('<u2').tobytes()
+	faceList = []
+	for v in range(0, triCount * 3, 3):
+		faceList.extend((indices[v+2], indices[v+1], indices[v]))
+	if faceList and (min(faceList) < 0 or max(faceList) > 65535):
+		raise ValueError("Face index out of the 16-bit range: " + str(max(faceList) if max(faceList) > 65535 else min(faceList)))
+	return struct.pack("<" + 'H'*len(faceList), *faceList)
+
+def unpack101010(buffer, count, stride=4, offset=0, bias=511.0, bWriteW=False):
+	#decodes count packed 10:10:10:2 vectors (normals, tangents, morph normal diffs) into a buffer of XYZ or XYZW floats:
+	if np is not None:
+		packed = np.ndarray((count, 1), dtype='<u4', buffer=buffer, offset=offset, strides=(stride, 4))
+		vecArray = (((packed >> np.array([0, 10, 20], dtype='<u4')) & 1023).astype(np.float64) - bias) / 512.0
+		if bWriteW:
+			vecArray = np.hstack((vecArray, np.zeros((count, 1)))) #the 2-bit W always decoded to 0.0
+		return vecArray.astype('<f4').tobytes()
+	vecList = []
+	for v in range(count):
+		packed = struct.unpack_from('<I', buffer, offset + stride * v)[0]
+		vecList.append(((packed & 1023) - bias) / 512.0)
+		vecList.append((((packed >> 10) & 1023) - bias) / 512.0)
+		vecList.append((((packed >> 20) & 1023) - bias) / 512.0)
+		if bWriteW:
+			vecList.append(0.0)
+	return struct.pack("<" + 'f'*len(vecList), *vecList)
+
+def scaleFloats(buffer, count, scale):
+	#the first count floats of buffer multiplied by scale, as a buffer of floats:
+	if np is not None:
+		return (np.frombuffer(buffer, dtype='<f4', count=count).astype(np.float64) * scale).astype('<f4').tobytes()
+	return struct.pack("<" + 'f'*count, *[value * scale for value in struct.unpack_from("<" + 'f'*count, buffer)])
+
+def interleaveRecords(first, second, stride):
+	#interleaves the stride-sized records of two buffers (first[0], second[0], first[1], second[1]...), as many as the shorter buffer holds:
+	count = min(len(first), len(second)) // stride
+	if np is not None:
+		records = np.empty((count, 2, stride), dtype=np.uint8)
+		records[:, 0] = np.frombuffer(first, dtype=np.uint8, count=count*stride).reshape(count, stride)
+		records[:, 1] = np.frombuffer(second, dtype=np.uint8, count=count*stride).reshape(count, stride)
+		return records.tobytes()
+	interleaved = bytearray(count * stride * 2)
+	for k in range(stride):
+		interleaved[k::stride*2] = first[k:count*stride:stride]
+		interleaved[stride+k::stride*2] = second[k:count*stride:stride]
+	return bytes(interleaved)
+
+def remapSkinInfluences(boneIndices, boneWeights, boneRemap):
+	#remaps the bone indices of every vertex to the mesh's bones (an unknown bone repeats the last known one of the vertex, or 0), returned with the weights as rows padded with zeros to equal length:
+	if np is not None:
+		def padRows(rows, dtype):
+			lengths = np.array([len(row) for row in rows], dtype=np.int64)
+			padded = np.zeros((len(rows), lengths.max() if len(rows) else 0), dtype=dtype)
+			mask = np.arange(padded.shape[1]) < lengths[:,None]
+			padded[mask] = np.fromiter((value for row in rows for value in row), dtype=dtype, count=int(lengths.sum()))
+			return padded, mask
+		indices, mask = padRows(boneIndices, np.int64)
+		weights = padRows(boneWeights, np.float64)[0]
+		remapped = np.asarray(boneRemap, dtype=np.int64).reshape(-1)[indices]
+		columns = np.arange(indices.shape[1])
+		lastGood = np.maximum.accumulate(np.where(mask & (remapped != -1), columns, -1), axis=1)
+		remapped = np.where(lastGood >= 0, np.take_along_axis(remapped, np.maximum(lastGood, 0), axis=1), 0)
+		remapped[~mask] = 0
+		return remapped, weights
+	indexRows = []
+	for row in boneIndices:
+		lastGoodIdx = 0
+		vertIndices = []
+		for boneIdx in row:
+			if boneRemap[boneIdx] != -1:
+				lastGoodIdx = boneRemap[boneIdx]
+			vertIndices.append(lastGoodIdx)
+		indexRows.append(vertIndices)
+	indexWidth = max([len(row) for row in indexRows] or [0])
+	weightRows = [list(row) for row in boneWeights]
+	weightWidth = max([len(row) for row in weightRows] or [0])
+	return [row + [0] * (indexWidth - len(row)) for row in indexRows], [row + [0.0] * (weightWidth - len(row)) for row in weightRows]
+
+def skinRowsFit(rows, width, byteValues=True):
+	#whether the padded rows of remapSkinInfluences are at most width columns wide (None for any width) and, with byteValues, every value fits a byte:
+	if np is not None:
+		return (width is None or rows.shape[1] <= width) and (not byteValues or bool(np.all((rows >= 0) & (rows <= 255))))
+	return (width is None or not rows or len(rows[0]) <= width) and (not byteValues or all(0 <= value <= 255 for row in rows for value in row))
+
+def packSkinColumns(rows, first, count, format):
+	#packs columns first to first+count of every row as one record per row, zero where a row is shorter. format is "B" (the values must fit a byte, see skinRowsFit) or "f":
+	if np is not None:
+		dtype = np.uint8 if format == "B" else '<f4'
+		records = np.zeros((len(rows), count), dtype=dtype)
+		columns = rows[:,first:first+count]
+		records[:,:columns.shape[1]] = columns
+		return records.tobytes()
+	packed = []
+	for row in rows:
+		columns = list(row[first:first+count])
+		packed.extend(columns + [0] * (count - len(columns)))
+	return struct.pack("<" + format*len(packed), *packed)
+
 def copyBuffers(originalFile, ext, maxBuffers):
 	#duplicates all buffers of mesh being modified for a complete export:
 	for root, dirs, files in os.walk(os.path.dirname(originalFile)):
@@ -151,21 +479,232 @@ def copyBuffers(originalFile, ext, maxBuffers):
 				
 
 
- 
-def GetCR2WBuffer(bs, buffers, ext="mesh", bufferNo=-1):
-	
-	def decompress(payload: bytes, size: int, output_size: int) -> bytes:
-		oodle = cdll.LoadLibrary(dllLocation)
-		output = create_string_buffer(output_size)
+
+class CR2WCodec:
+	#compression backend for CR2W buffers: handles the "KARK" header and a pool of scratch buffers reused across compressions
+	name = ""
+	def __init__(self):
+		self.scratchPool = []
+		self.poolLock = threading.Lock()
+		
+	def acquireScratch(self, size):
+		with self.poolLock:
+			for s, scratch in enumerate(self.scratchPool):
+				if len(scratch) >= size:
+					return self.scratchPool.pop(s)
+		return bytearray(size)
+		
+	def releaseScratch(self, scratch):
+		if scratch is None:
+			return
+		with self.poolLock:
+			self.scratchPool.append(scratch)
+			self.scratchPool.sort(key=len)
+			if len(self.scratchPool) > 4:
+				self.scratchPool.pop(0)
+				
+	def decompress(self, payload, outputSize):
+		#payload is a memoryview, usually into the file data. Returns (returned size, outputSize bytes of output). Backends override this, the base codec reports a failed decompression
+		return (0, bytes(outputSize))
+		
+	def compress(self, data, codec=8, level=9):
+		#returns the compressed bytes of data, or an empty bytes object if compression failed. Backends override this, the base codec reports a failed compression
+		return b''
+		
+	def decodeBuffer(self, data, outputSize):
+		#decompresses a KARK buffer (magic, uncompressed size, payload) to outputSize bytes
+		if data[:4] != b'KARK':
+			print ("Warning: Buffer is missing its KARK header")
+		return self.decompress(memoryview(data)[8:], outputSize)
+		
+	def encodeBuffer(self, data, codec=8, level=9):
+		#compresses data into a KARK buffer; only the 8 byte header is returned if compression failed
+		return struct.pack("<II", 1263681867, len(data)) + self.compress(data, codec, level)
+		
+
+class OodleCodec(CR2WCodec):
+	#the game's Oodle library, loaded once
+	name = "oodle"
+	def __init__(self, lib, bSizeNeededTakesCodec=False):
+		super().__init__()
+		self.lib = lib
+		self.bSizeNeededTakesCodec = bSizeNeededTakesCodec #newer Oodle builds (the Linux .so) take the compressor as first argument
+			
+	def decompress(self, payload, outputSize):
+		#decompresses straight into a buffer of the exact output size, which is handed to NoeBitStream as is
+		output = bytearray(outputSize)
+		outputBuffer = (c_char * outputSize).from_buffer(output)
+		if np is not None:
+			payloadArray = np.frombuffer(payload, dtype=np.uint8) #points Oodle at the payload where it is; ctypes alone can only point at read-only memory by copying it to bytes
+			payloadPointer = c_void_p(payloadArray.ctypes.data)
+		else:
+			payloadPointer = c_char_p(bytes(payload))
 		#typedef long long (*OodleLZ_Decompress)(void* in, long long insz, void* out, long long outsz, long long a, long long b, long long c, void* d, void* e, void* f, void* g, void* h, void* i, long long j);
-		ret = oodle.OodleLZ_Decompress( c_char_p(payload), c_int64(size), output, c_int64(output_size), c_int64(0), c_int64(0), c_int64(0), None, None, None, None, None, None, c_int64(3))
+		ret = self.lib.OodleLZ_Decompress( payloadPointer, c_int64(len(payload)), outputBuffer, c_int64(outputSize), c_int64(0), c_int64(0), c_int64(0), None, None, None, None, None, None, c_int64(3))
+		del outputBuffer
+		return (ret, output)
 		
-		if ret != output_size:
-			print ("Buffer", bufferNo, "decompression failed! Returned size:", ret, "Actual size:", len(output))
+	def compress(self, data, codec=8, level=9):
+		if self.bSizeNeededTakesCodec:
+			scratch = self.acquireScratch(self.lib.OodleLZ_GetCompressedBufferSizeNeeded(c_int64(codec), c_int64(len(data))))
 		else:
-			print ("Buffer", bufferNo, "decompression succeeded! Returned size:", ret, "Actual size:", len(output)) 
-		return (ret, output.raw)
+			scratch = self.acquireScratch(self.lib.OodleLZ_GetCompressedBufferSizeNeeded(c_int64(len(data))))
+		output = (c_char * len(scratch)).from_buffer(scratch)
+		#typedef int WINAPI OodLZ_CompressFunc( int codec, uint8 *src_buf, size_t src_len, uint8 *dst_buf, int level, void *opts, size_t offs, size_t unused, void *scratch, size_t scratch_size);
+		outputSize = self.lib.OodleLZ_Compress( c_int64(codec), c_char_p(bytes(data)), c_int64(len(data)), output, c_int64(level), None, None, None, None, None)
+		del output
+		compressed = bytes(scratch[:outputSize]) if outputSize > 0 else b''
+		self.releaseScratch(scratch)
+		return compressed
 		
+
+class StandInCodec(CR2WCodec):
+	#deterministic zlib codec for running the read/write pipeline without the game installed; its buffers do not load in the game
+	name = "standin"
+	def decompress(self, payload, outputSize):
+		try:
+			output = zlib.decompress(payload)
+		except zlib.error:
+			return (0, bytes(outputSize))
+		return (len(output), output[:outputSize])
+		
+	def compress(self, data, codec=8, level=9):
+		return zlib.compress(bytes(data), level) #Oodle levels 0-9 map onto zlib's
+		
+
+#(Oodle codec, Oodle level) of each compressionProfile; codec 8 is Kraken, levels are 1 = SuperFast, 4 = Normal, 9 = Optimal5
+compressionProfiles = {
+	"fast iteration": (8, 1),
+	"balanced": (8, 4),
+	"ship": (8, 9),
+}
+
+def getCacheFolder(name):
+	#returns a cache subfolder next to CP77ExtractedPath.txt, creating it if needed
+	folder = os.path.join(noesis.getPluginsPath() + 'python', 'CP77Cache', name)
+	os.makedirs(folder, exist_ok=True)
+	return folder
+	
+
+class DiskCache:
+	#size-limited folder of cache files named by key, the least recently used files are removed first
+	extension = ".cache"
+	
+	def __init__(self, folder, maxSize):
+		self.folder = folder
+		self.maxSize = maxSize
+		self.pruneLock = threading.Lock()
+		
+	def get(self, key):
+		path = os.path.join(self.folder, key + self.extension)
+		try:
+			with open(path, "rb") as cacheFile:
+				cachedBytes = cacheFile.read()
+			os.utime(path) #mark as recently used
+		except OSError:
+			return None
+		return cachedBytes
+		
+	def put(self, key, cachedBytes, bPrune=True):
+		#stores cachedBytes under key; callers storing many entries at once pass bPrune=False and call prune once afterwards
+		path = os.path.join(self.folder, key + self.extension)
+		try:
+			with open(path + "." + str(threading.get_ident()) + ".tmp", "wb") as cacheFile:
+				cacheFile.write(cachedBytes)
+			os.replace(path + "." + str(threading.get_ident()) + ".tmp", path)
+		except OSError:
+			return
+		if bPrune:
+			self.prune()
+		
+	def prune(self):
+		#removes the least recently used entries once the cache is over its size limit
+		with self.pruneLock:
+			try:
+				entries = [entry for entry in os.scandir(self.folder) if entry.name.endswith(self.extension)]
+				totalSize = sum(entry.stat().st_size for entry in entries)
+				if totalSize <= self.maxSize:
+					return
+				for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+					totalSize -= entry.stat().st_size
+					os.remove(entry.path)
+					if totalSize <= self.maxSize:
+						break
+			except OSError:
+				pass
+				
+
+class CompressedBufferCache(DiskCache):
+	#on-disk cache of compressed buffers keyed by a hash of the uncompressed bytes and the codec settings
+	extension = ".kark"
+	
+	def makeKey(self, data, codecName, codec, level):
+		hasher = hashlib.blake2b(digest_size=20)
+		hasher.update((codecName + "," + str(codec) + "," + str(level) + ",").encode())
+		hasher.update(data)
+		return hasher.hexdigest()
+		
+compressedBufferCache = None
+
+def getCompressedBufferCache():
+	#returns the shared CompressedBufferCache, or None if it is disabled or its folder is unavailable
+	global compressedBufferCache, bCompressionCache
+	if bCompressionCache and compressedBufferCache is None:
+		try:
+			compressedBufferCache = CompressedBufferCache(getCacheFolder("buffers"), compressionCacheMB * 1048576)
+		except Exception as e:
+			print ("Compressed buffer cache is disabled:", e)
+			bCompressionCache = False
+	return compressedBufferCache if bCompressionCache else None
+
+def getCompressionProfile():
+	#returns the compression profile name chosen by the -cp77compression export option or the compressionProfile setting
+	profile = compressionProfile
+	if noesis.optWasInvoked("-cp77compression"):
+		profile = noesis.optGetArg("-cp77compression")
+	profile = profile.lower().replace("_", " ").replace("-", " ").strip()
+	for name in compressionProfiles:
+		if name == profile or name.startswith(profile + " "):
+			return name
+	print ("Unknown compression profile \"" + profile + "\", using \"ship\"")
+	return "ship"
+
+def loadCompressionCodec(backend=""):
+	#returns the codec for the given compressionBackend, or None if it could not be loaded or the backend is unknown
+	backend = backend.lower().strip()
+	if backend == "standin":
+		print ("Using stand-in compression: exported buffers will not load in the game!")
+		return StandInCodec()
+	if backend not in ("", "oodle"):
+		print ("Unknown compressionBackend \"" + backend + "\", it must be \"oodle\", \"standin\" or blank")
+		return None
+	folders = [os.path.dirname(dllLocation)]
+	try:
+		folders.append(noesis.getPluginsPath() + 'python') #look for Oodle in Noesis plugins folder
+		folders.append(os.path.dirname(os.path.abspath(__file__)))
+	except:
+		pass
+	if os.name == "nt":
+		candidates = [dllLocation] + [os.path.join(folder, "oo2ext_7_win64.dll") for folder in folders[1:]]
+	else:
+		candidates = [os.path.join(folder, libName) for folder in folders for libName in ("liboo2corelinux64.so.9", "liboo2corelinux64.so")]
+	for path in candidates:
+		try:
+			return OodleCodec(cdll.LoadLibrary(path), os.name != "nt")
+		except OSError:
+			continue
+	return None
+	
+compressionCodec = loadCompressionCodec(compressionBackend) if bCompress else None
+if bCompress and compressionCodec is None:
+	if compressionBackend.lower().strip() in ("", "oodle"):
+		print ("Could not load Oodle DLL! Cyberpunk 2077 Compression is disabled")
+	else:
+		print ("Cyberpunk 2077 Compression is disabled")
+	bCompress = False
+
+def GetCR2WBuffer(bs, buffers, ext="mesh", bufferNo=-1, recorder=None):
+	
 	if int(bufferNo) < 0:
 		return NoeBitStream()
 		
@@ -173,15 +712,21 @@ def GetCR2WBuffer(bs, buffers, ext="mesh", bufferNo=-1):
 	#Extract KARK buffer to create bitstream:
 	if bCompress:
 		if buffers[bufferNo].memSize == buffers[bufferNo].diskSize: #if already decompressed
-			bs.seek(buffers[bufferNo].offset)
-			output = (buffers[bufferNo].diskSize, bs.readBytes(buffers[bufferNo].diskSize))
+			output = (buffers[bufferNo].diskSize, NoeBitStream(bytes(readBufferBytes(bs, buffers[bufferNo], buffers[bufferNo].diskSize))))
 			print ("Read already-decompressed Buffer", bufferNo)
 		else:	
 			payload_size = buffers[bufferNo].diskSize-8
 			output_size = buffers[bufferNo].memSize
-			bs.seek(buffers[bufferNo].offset+8)
-			payload = bs.readBytes(payload_size)
-			output = decompress(payload, payload_size, output_size)
+			if buffers[bufferNo].decompressed is not None:
+				ret, decompressed = buffers[bufferNo].decompressed
+				buffers[bufferNo].decompressed = None #the stream gets its own copy, so the prefetched bytes are not kept for the rest of the import
+			else:
+				ret, decompressed = compressionCodec.decodeBuffer(readBufferBytes(bs, buffers[bufferNo], payload_size+8), output_size)
+			if ret != output_size:
+				print ("Buffer", bufferNo, "decompression failed! Returned size:", ret, "Actual size:", output_size)
+			else:
+				print ("Buffer", bufferNo, "decompression succeeded! Returned size:", ret, "Actual size:", output_size) 
+			output = (ret, NoeBitStream(decompressed))
 		
 	if output[0] == 0:
 		#Grab correct paired buffer file
@@ -193,38 +738,82 @@ def GetCR2WBuffer(bs, buffers, ext="mesh", bufferNo=-1):
 				lowerName = fileName.lower()
 				if lowerName.endswith(ext + "." + str(bufferNo) + ".buffer") and lowerName.split(ext)[0] == thisName.split(ext)[0]:
 					print("Detected Buffer: " + lowerName)
+					if recorder is not None:
+						recorder.stampFile(os.path.join(root, lowerName))
 					return ( NoeBitStream(rapi.loadIntoByteArray(os.path.join(root, lowerName))))
-	return NoeBitStream(output[1])
+	if output[1] is None:
+		return NoeBitStream()
+	return output[1]
 	
 	
+def prefetchCR2WBuffers(bs, buffers, bufferNos=None):
+	#decompresses the compressed buffers numbered in bufferNos (or all of them) concurrently (the codecs release the GIL), for GetCR2WBuffer to pick up
+	def decodeJob(job):
+		return compressionCodec.decodeBuffer(job[1], job[0].memSize)
+			
+	pos = bs.tell()
+	jobs = []
+	for b, buffer in enumerate(buffers):
+		if (bufferNos is None or b in bufferNos) and buffer.memSize != buffer.diskSize and buffer.decompressed is None:
+			jobs.append((buffer, readBufferBytes(bs, buffer, buffer.diskSize)))
+	bs.seek(pos)
+	if not jobs:
+		return
+	with ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+		for job, result in zip(jobs, pool.map(decodeJob, jobs)):
+			job[0].decompressed = result
+			
+
 def WriteCR2WBuffer(buffers, buf, bufferNo):
-	
-	input_buffer = create_string_buffer(buf.getBuffer())
-	input_size = buf.getSize()
-	output_size = lib.OodleLZ_GetCompressedBufferSizeNeeded(c_int64(input_size))
-	output = create_string_buffer(output_size)
-	#typedef int WINAPI OodLZ_CompressFunc( int codec, uint8 *src_buf, size_t src_len, uint8 *dst_buf, int level, void *opts, size_t offs, size_t unused, void *scratch, size_t scratch_size);
-	output_size = lib.OodleLZ_Compress( c_int64(8), input_buffer, c_int64(input_size), output, c_int64(9), None, None, None, None, None)
-	compressedBytes = NoeBitStream()
-	compressedBytes.writeUInt(1263681867) #KARK
-	compressedBytes.writeUInt(input_size) #decompressed buffer size
-	compressedBytes.writeBytes(bytes(output)[:output_size]) #crimp to size
-	compressedBytes = compressedBytes.getBuffer()
-	if output_size == 0:
-		print ("Compression Failed! Reported Size: ", output_size, "Actual Size:", len(compressedBytes))
-	else:
-		print ("Compression Succeeded! Reported Size:", output_size, "Actual Size:", len(compressedBytes)-8)
-	diff = output_size - (buffers[bufferNo].diskSize-8)
-	
-	buffers[bufferNo].data.writeBytes(compressedBytes)
-	buffers[bufferNo].diskSize = buffers[bufferNo].data.getSize()
+	#queues buf as the new contents of buffer bufferNo; it is compressed when writeCR2WBuffers writes the file
+	buffers[bufferNo].pending = buf.getBuffer()
 	buffers[bufferNo].memSize = buf.getSize()
+	return buffers
 	
-	for i in range(len(buffers)):
-		if buffers[i].offset > buffers[bufferNo].offset:
-			buffers[i].offset += diff
 	
-	return buffers
+def writeCR2WBuffers(outfile, f, buffers, profile="ship"):
+	#compresses all queued buffers in a worker pool and streams every buffer to outfile in order as they finish, then writes the buffer table once
+	codec, level = compressionProfiles[profile]
+	cache = getCompressedBufferCache()
+	def encodeJob(data):
+		start = time.perf_counter()
+		if cache:
+			key = cache.makeKey(data, compressionCodec.name, codec, level)
+			compressedBytes = cache.get(key)
+			if compressedBytes is not None:
+				return (compressedBytes, time.perf_counter() - start, True)
+		compressedBytes = compressionCodec.encodeBuffer(data, codec, level)
+		if cache and len(compressedBytes) > 8:
+			cache.put(key, compressedBytes, False)
+		return (compressedBytes, time.perf_counter() - start, False)
+		
+	with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+		jobs = [(pool.submit(encodeJob, buff.pending) if buff.pending is not None else None) for buff in buffers]
+		for b, (buff, job) in enumerate(zip(buffers, jobs)):
+			if job is not None:
+				compressedBytes, seconds, bCached = job.result()
+				output_size = len(compressedBytes) - 8
+				if output_size == 0:
+					print ("Buffer", b, "compression failed! Profile:", profile, "Reported Size: ", output_size, "Actual Size:", len(compressedBytes))
+				else:
+					print ("Buffer", b, "compressed with profile \"" + profile + "\":", buff.memSize, "->", output_size, "bytes in", "%.3f" % seconds, "seconds" + (" (cached)" if bCached else ""))
+				buff.data = NoeBitStream(compressedBytes)
+				buff.pending = None
+			if buff.data.getSize() == 0:
+				f.seek(buff.origOffset)
+				buff.data.writeBytes(f.readBytes(buff.diskSize))
+			buff.offset = outfile.tell()
+			outfile.writeBytes(buff.data.getBuffer())
+			buff.diskSize = buff.data.getSize()
+	if cache:
+		cache.prune() #once per export rather than after every stored buffer
+	for buff in buffers:
+		outfile.seek(buff.bufferOffset + 8)
+		outfile.writeUInt(buff.offset)
+		outfile.writeUInt(buff.diskSize)
+		outfile.writeUInt(buff.memSize)
+	outfile.seek(28)
+	outfile.writeUInt(outfile.getSize()) #bufferSize
 	
 
 def buildFlagFromNames(names, nameToIndex, padding, findSimilar=False, typeOrName=-1):
@@ -259,8 +848,240 @@ def findFlag(bs, flag, maxOffset, skipFlag=0, skipFlag2=0):
 		else:
 			bs.seek(checkPoint+1)
 	return False
-	
-	
+
+#serialized sizes of values that never hold nested properties, so arrays of them are stepped over without reading each element
+cr2wValueSizes = {
+	"Bool": 1, "Int8": 1, "Uint8": 1, "Int16": 2, "Uint16": 2, "Int32": 4, "Uint32": 4,
+	"Int64": 8, "Uint64": 8, "Float": 4, "Double": 8, "CName": 2,
+}
+cr2wPointerSizes = (("handle:", 4), ("whandle:", 4), ("rRef:", 2), ("raRef:", 2))
+#raw data types that are never read as nested properties
+cr2wOpaqueTypes = ("DataBuffer", "SharedDataBuffer", "serializationDeferredDataBuffer", "String", "LocalizationString")
+
+def getCR2WValueSize(typeName):
+	size = cr2wValueSizes.get(typeName)
+	if size is None:
+		for prefix, pointerSize in cr2wPointerSizes:
+			if typeName.startswith(prefix):
+				return pointerSize
+	return size
+
+def getCR2WElementType(typeName):
+	#"array:Uint32" and "static:5,Uint32" -> "Uint32", None if not an array
+	if typeName.startswith("array:"):
+		return typeName[6:]
+	if typeName.startswith("static:"):
+		return typeName.split(",", 1)[1]
+	return None
+
+class CR2WProperty:
+	#a serialized property header (name, type, size); nested properties are only parsed when asked for
+	def __init__(self, reader, offset, nameIdx, typeIdx, size):
+		self.reader = reader
+		self.offset = offset
+		self.nameIdx = nameIdx
+		self.typeIdx = typeIdx
+		self.name = reader.names[nameIdx]
+		self.type = reader.names[typeIdx]
+		self.size = size
+		self.valueOffset = offset + 8
+		self.end = offset + 4 + size
+		self._elements = None
+		
+	def elements(self):
+		#property lists of a class value (one element), or of every element of an array of classes
+		if self._elements is None:
+			self._elements = self.reader.readValue(self.type, self.valueOffset, self.end)
+		return self._elements
+		
+	def properties(self):
+		return [prop for element in self.elements() for prop in element]
+		
+	def get(self, name, typeName=None):
+		for prop in self.properties():
+			if prop.name == name and (typeName is None or prop.type == typeName):
+				return prop
+		
+	def __repr__(self):
+		return "(CR2WProperty:" + self.name + "," + self.type + "," + repr(self.offset) + "," + repr(self.size) + ")"
+
+class CR2WReader:
+	#lazy reader over the property tree of one export: whole properties are jumped over by their size field and only expanded on request
+	def __init__(self, data, names, offset=0, end=None):
+		self.data = data
+		self.names = names
+		self.offset = offset
+		self.end = len(data) if end is None else end
+		self.unparsed = [] #(start, end) spans whose contents could not be read as properties
+		self._properties = None
+		
+	def properties(self):
+		if self._properties is None:
+			self._properties, classEnd = self.readClass(self.offset, self.end, True)
+			if classEnd < self.end:
+				self.addUnparsed(classEnd, self.end)
+		return self._properties
+		
+	def get(self, name, typeName=None):
+		for prop in self.properties():
+			if prop.name == name and (typeName is None or prop.type == typeName):
+				return prop
+				
+	def walk(self, props=None):
+		#every property in file order, descending into classes and arrays of classes
+		for prop in (self.properties() if props is None else props):
+			yield prop
+			for element in prop.elements():
+				yield from self.walk(element)
+				
+	def addUnparsed(self, start, end):
+		if end - start >= 8:
+			self.unparsed.append((start, end))
+		
+	def readHeader(self, p, end):
+		if p + 8 > end:
+			return None
+		nameIdx, typeIdx, size = struct.unpack_from("<HHI", self.data, p)
+		if nameIdx >= len(self.names) or typeIdx == 0 or typeIdx >= len(self.names) or self.names[typeIdx] == "" or size < 4:
+			return None
+		return nameIdx, typeIdx, size
+		
+	def readClass(self, p, end, lenient=False):
+		#a class is a zero byte, its properties and a terminating zero name index
+		props = []
+		if p < end and self.data[p] == 0:
+			p += 1
+			while p + 2 <= end:
+				if self.data[p] == 0 and self.data[p+1] == 0:
+					return props, p + 2
+				header = self.readHeader(p, end)
+				if header is None or (p + 4 + header[2] > end and not lenient):
+					break
+				props.append(CR2WProperty(self, p, *header))
+				p += 4 + header[2]
+		if lenient: #top level: keep what was read, even if the blob was cut off
+			return props, p
+		return None
+		
+	def readArray(self, elementType, p, end):
+		#arrays are an element count followed by the elements; returns (element property lists, array end)
+		if p + 4 > end:
+			return None
+		count = struct.unpack_from("<I", self.data, p)[0]
+		p += 4
+		size = getCR2WValueSize(elementType)
+		if size is not None:
+			p += count * size
+			return ([], p) if p <= end else None
+		if elementType in cr2wOpaqueTypes or p + count * 3 > end:
+			return None
+		subType = getCR2WElementType(elementType)
+		elements = []
+		for i in range(count):
+			result = self.readArray(subType, p, end) if subType is not None else self.readClass(p, end)
+			if result is None:
+				return None
+			if subType is not None:
+				elements.extend(result[0])
+			else:
+				elements.append(result[0])
+			p = result[1]
+		return elements, p
+		
+	def readValue(self, typeName, start, end):
+		end = min(end, self.end)
+		elementType = getCR2WElementType(typeName)
+		if elementType is not None:
+			result = self.readArray(elementType, start, end)
+		elif getCR2WValueSize(typeName) is not None or typeName in cr2wOpaqueTypes:
+			return []
+		else:
+			result = self.readClass(start, end)
+			if result is not None:
+				result = ([result[0]], result[1])
+		if result is None:
+			self.addUnparsed(start, end)
+			return []
+		if result[1] < end:
+			self.addUnparsed(result[1], end)
+		return result[0]
+
+class CR2WPropertyIndex:
+	#map of every property header (nameIdx, typeIdx) in one export blob, or in every export of a file, to its offsets
+	#built by walking the property tree once, so flag lookups are exact and don't rescan the data
+	def __init__(self, bs, names, exports=None, data=None):
+		self.offsets = {}
+		if data is None:
+			data = bs.getBuffer()
+		spans = [(export.offset, export.dataEnd) for export in exports] if exports else [(0, len(data))]
+		for start, end in spans:
+			reader = CR2WReader(data, names, start, end)
+			for prop in reader.walk():
+				key = bytes(data[prop.offset:prop.offset+4])
+				offsets = self.offsets.get(key)
+				if offsets is None:
+					self.offsets[key] = [prop.offset]
+				else:
+					offsets.append(prop.offset)
+			for spanStart, spanEnd in reader.unparsed: #fall back to byte-scanning data that isn't understood as properties
+				self.scanBytes(data, spanStart, spanEnd, len(names))
+		for offsets in self.offsets.values():
+			offsets.sort()
+			
+	def scanBytes(self, data, start, end, nameCount):
+		for o in range(start, min(end, len(data)) - 3):
+			if 0 < (data[o] | (data[o+1] << 8)) < nameCount and 0 < (data[o+2] | (data[o+3] << 8)) < nameCount:
+				key = bytes(data[o:o+4])
+				offsets = self.offsets.get(key)
+				if offsets is None:
+					self.offsets[key] = [o]
+				else:
+					offsets.append(o)
+	
+	def find(self, bs, flag):
+		#seeks to the first occurrence of flag at or after the current position, the same as findFlag
+		offsets = self.offsets.get(flag)
+		if offsets:
+			i = bisect_left(offsets, bs.tell())
+			if i < len(offsets):
+				bs.seek(offsets[i])
+				return True
+		bs.seek(bs.getSize())
+		return False
+
+
+class CR2WSource:
+	#memoryview over a loaded CR2W file: buffers are decompressed and property headers indexed straight from slices of the file data. Streams are built from a bytes copy of their slice, as NoeBitStream only documents bytes input
+	def __init__(self, data):
+		self.view = memoryview(data)
+		
+	def slice(self, offset, size):
+		return self.view[offset:offset+size]
+		
+	def stream(self, offset, size):
+		return NoeBitStream(self.slice(offset, size).tobytes())
+		
+	def exportSlice(self, export):
+		return self.slice(export.offset, export.dataSize)
+		
+	def exportStream(self, export):
+		return self.stream(export.offset, export.dataSize)
+		
+	def attachBuffers(self, buffers):
+		#lets GetCR2WBuffer and prefetchCR2WBuffers read the buffers as slices
+		for buffer in buffers:
+			buffer.source = self
+
+
+def readBufferBytes(bs, buffer, size):
+	#the first size bytes of a buffer in the file, sliced from its CR2WSource when there is one
+	if buffer.source is not None:
+		bs.seek(buffer.offset + size)
+		return buffer.source.slice(buffer.offset, size)
+	bs.seek(buffer.offset)
+	return bs.readBytes(size)
+
+
 def ParseHeader(bs):
 	bs.seek(0)
 	magic = bs.readUInt()
@@ -352,6 +1173,9 @@ class CP77Buffer:
 		self.bufferOffset = bufferOffset
 		self.origOffset = offset
 		self.data = data
+		self.decompressed = None #(returned size, bytes) once decompressed by prefetchCR2WBuffers, until GetCR2WBuffer reads it
+		self.pending = None #new uncompressed contents queued by WriteCR2WBuffer
+		self.source = None #CR2WSource of the file, set by CR2WSource.attachBuffers
 	def __repr__(self):
 		return "(CP77Buffer:" + self.flags + "," + repr(self.index) + "," + repr(self.offset) + "," + repr(self.diskSize) + repr(self.memSize) + repr(self.CRC32) + repr(self.bufferOffset) + ")"
 
@@ -385,7 +1209,7 @@ def xbmLoadDDS(data, texList):
 	numBuffers = readUShortAt(f, 104)
 	strings, nameToIndex, maxOffset, EXPORTS, exportNames, buffers = ParseHeader(f)
 	checkPoint = f.tell()	
-	
+	CR2WSource(data).attachBuffers(buffers)
 	
 	if not ("CBitmapTexture" in strings and "width" in strings and "height" in strings and "rendRenderTextureBlobSizeInfo" in strings):
 		print ("Required CNames not found!\n")
@@ -403,12 +1227,7 @@ def xbmLoadDDS(data, texList):
 		print ("Texture data Buffer not found")
 		return 0
 		
-	skipFlag = 0
-	skipFlag2 = 0
-	
-	if rapi.getInputName().find("mesh") != -1:
-		skipFlag = buildFlagFromNames(["topology","array:rendTopologyData"], nameToIndex, 0) 
-		skipFlag2 = buildFlagFromNames(["simulation", "array:Uint16"],nameToIndex,0) 
+	fIndex = CR2WPropertyIndex(f, strings, EXPORTS)
 	compressionFlag = buildFlagFromNames(["compression","ETextureCompression"], nameToIndex, 0) 
 	
 	name = rapi.getInputName()
@@ -428,7 +1247,7 @@ def xbmLoadDDS(data, texList):
 		pos = f.tell()
 		bufferIdx = -1
 		
-		if findFlag(f, dataBufferFlag, maxOffset, skipFlag, skipFlag2): #and readUShortAt(f, f.tell()+8) < numBuffers
+		if fIndex.find(f, dataBufferFlag): #and readUShortAt(f, f.tell()+8) < numBuffers
 			for e, export in enumerate(EXPORTS):
 				if export.offset > pos and export.offset < f.tell():
 					if EXPORTS[e-1].name == "CBitmapTexture":
@@ -443,7 +1262,7 @@ def xbmLoadDDS(data, texList):
 			break
 		
 		f.seek(pos)
-		if findFlag(f, compressionFlag, bufferMaxOffset, skipFlag):
+		if fIndex.find(f, compressionFlag):
 			f.seek(8,1)
 			try:
 				formatString = strings[f.readUShort()]	
@@ -452,7 +1271,7 @@ def xbmLoadDDS(data, texList):
 			
 		f.seek(pos)
 		
-		if findFlag(f, dimsFlag, bufferMaxOffset, skipFlag):
+		if fIndex.find(f, dimsFlag):
 			if bIsMorphtarget:
 				formatString = "TCM_QualityColor"
 				f.seek(12,1)
@@ -501,6 +1320,9 @@ def xbmLoadDDS(data, texList):
 			print ("	  (" + str(ddsFmt) + ")" )
 	
 	
+	if bCompress and bParallelDecompress:
+		prefetchCR2WBuffers(f, buffers, set(theTexture.bufferNo-1 for theTexture in TEXTURES))
+	
 	for theTexture in TEXTURES:
 		#print (theTexture.compression)
 		if theTexture.bufferNo == 0 or (rapi.checkFileExists(theTexture.path) == False and bCompress == False):
@@ -654,11 +1476,7 @@ def xbmWriteRGBA(data, width, height, outfile):
 		print ("\nError: Texture data Buffer not found")
 		return 0
 	compressionFlag = buildFlagFromNames(["compression","ETextureCompression"], nameToIndex, 0) 
-	skipFlag = 0
-	skipFlag2 = 0
-	if not isXBM:
-		skipFlag = buildFlagFromNames(["topology","array:rendTopologyData"],nameToIndex,0) 
-		skipFlag2 = buildFlagFromNames(["simulation", "array:Uint16"],nameToIndex,0) 
+	fIndex = CR2WPropertyIndex(f, strings, EXPORTS) #also valid for bs, which is a copy of f
 		
 	name = textureName
 	ext = os.path.splitext(name)
@@ -678,7 +1496,7 @@ def xbmWriteRGBA(data, width, height, outfile):
 		pos = f.tell()
 		
 		bufferIdx = -1
-		if findFlag(f, dataBufferFlag, maxOffset, skipFlag, skipFlag2):
+		if fIndex.find(f, dataBufferFlag):
 			for e, export in enumerate(EXPORTS):
 				if export.offset > pos and export.offset < f.tell():
 					if EXPORTS[e-1].name == "CBitmapTexture":
@@ -693,7 +1511,7 @@ def xbmWriteRGBA(data, width, height, outfile):
 			break
 		
 		f.seek(pos)
-		if findFlag(f, compressionFlag, bufferMaxOffset, skipFlag):
+		if fIndex.find(f, compressionFlag):
 			f.seek(8,1)
 			try:
 				formatString = strings[f.readUShort()]	
@@ -701,7 +1519,7 @@ def xbmWriteRGBA(data, width, height, outfile):
 				pass
 		f.seek(pos)
 		
-		if findFlag(f, dimsFlag, bufferMaxOffset, skipFlag):
+		if fIndex.find(f, dimsFlag):
 			if bIsMorphtarget:
 				formatString = "TCM_QualityColor"
 				f.seek(12,1)
@@ -812,7 +1630,7 @@ def xbmWriteRGBA(data, width, height, outfile):
 	bs.seek(theTexture.height[1])
 	bWriteMips = False
 	mipFlag = buildFlagFromNames(["mipMapInfo","array:rendRenderTextureBlobMipMapInfo"],nameToIndex,0) 
-	if (width != theTexture.width[0] or height != theTexture.height[0]) and findFlag(bs, mipFlag, maxOffset, 0): 
+	if (width != theTexture.width[0] or height != theTexture.height[0]) and fIndex.find(bs, mipFlag): 
 		bWriteMips = True
 		bs.seek(8,1)
 		maxMips = bs.readUInt()
@@ -862,7 +1680,7 @@ def xbmWriteRGBA(data, width, height, outfile):
 	if bWriteMips:
 		bs.seek(0)
 		imgSizeFlag = buildFlagFromNames(["textureDataSize","Uint32"],nameToIndex,0) 
-		if findFlag(bs, imgSizeFlag, maxOffset, 0):
+		if fIndex.find(bs, imgSizeFlag):
 			bs.seek(8,1)
 			bs.writeUInt(nf.getSize()) #imgSize
 			bs.seek(8,1)
@@ -872,20 +1690,7 @@ def xbmWriteRGBA(data, width, height, outfile):
 		buffers = WriteCR2WBuffer(buffers, nf, theTexture.bufferNo-1)
 		bs.seek(0)
 		outfile.writeBytes(bs.readBytes(buffers[0].offset)) #write CR2W part
-		for buff in buffers:
-			if buff.data.getSize() == 0:
-				f.seek(buff.origOffset)
-				buff.data.writeBytes(f.readBytes(buff.diskSize))
-			buff.offset = outfile.tell()
-			outfile.writeBytes(buff.data.getBuffer())
-			buff.diskSize = buff.data.getSize()
-		for buff in buffers:
-			outfile.seek(buff.bufferOffset + 8)
-			outfile.writeUInt(buff.offset)
-			outfile.writeUInt(buff.diskSize)
-			outfile.writeUInt(buff.memSize)
-		outfile.seek(28)
-		outfile.writeUInt(outfile.getSize()) #bufferSize
+		writeCR2WBuffers(outfile, f, buffers, getCompressionProfile())
 	else:
 		newBufferName = (rapi.getOutputName().split("cp77tex")[0] + "." + str(theTexture.bufferNo-1) + ".buffer").replace("..", ".")
 		if isXBM:
@@ -902,10 +1707,13 @@ def xbmWriteRGBA(data, width, height, outfile):
 
 #////////////////////////////////////////////////////////////////////////////////// MESH IMPORT / EXPORT //////////////////////////////////////////////////////////////////////////////////
 	
-def parseGarmentMesh(f, indexToName, nameToIndex, gMesh, doGarmentMesh, doGarmentMesh2, skipFlag): #the worst part of making this tool
+def parseGarmentMesh(f, indexToName, nameToIndex, gMesh, doGarmentMesh, doGarmentMesh2, source=None): #the worst part of making this tool
 
-	f.seek(gMesh.offset)
-	gm = NoeBitStream(f.readBytes(gMesh.dataSize))
+	if source is not None:
+		gm = source.exportStream(gMesh)
+	else:
+		f.seek(gMesh.offset)
+		gm = NoeBitStream(f.readBytes(gMesh.dataSize))
 	
 	GMESH = namedtuple("GMESH", "offset vertices indices morphOffsets garmentFlags skinWeights skinIndices skinWeightsExt skinIndicesExt")
 	GMESHES = []
@@ -913,16 +1721,17 @@ def parseGarmentMesh(f, indexToName, nameToIndex, gMesh, doGarmentMesh, doGarmen
 	if doGarmentMesh2:
 		gmFlag = buildFlagFromNames(["positions", "DataBuffer"],nameToIndex,0)  
 		gmFlagSpcl = buildFlagFromNames(["chunks", "array:meshGfxClothChunkData"],nameToIndex,0) 
-		skipFlag = buildFlagFromNames(["simulation", "array:Uint16"],nameToIndex,0) 
-		findFlag(gm, gmFlagSpcl, gMesh.dataSize, skipFlag)
+		gmIndex = CR2WPropertyIndex(gm, indexToName)
+		gmIndex.find(gm, gmFlagSpcl)
 		gm.seek(-1,1)
 	else:
 		gmFlag = buildFlagFromNames(["vertices", "DataBuffer"],nameToIndex,0)  
+		gmIndex = CR2WPropertyIndex(gm, indexToName)
 	
 	gm.seek(9,1)
 	gMeshCount = gm.readUInt()
 	gMeshIdx = 0
-	while gMeshIdx < gMeshCount and findFlag(gm, gmFlag, gMesh.dataSize, skipFlag) is not False:
+	while gMeshIdx < gMeshCount and gmIndex.find(gm, gmFlag) is not False:
 		try:
 			pos = gm.tell()
 			gOffset = -1
@@ -967,7 +1776,121 @@ def parseGarmentMesh(f, indexToName, nameToIndex, gMesh, doGarmentMesh, doGarmen
 		
 	return GMESHES
 
-def parseMorphs(mm, mMesh, nameToIndex, submeshCount, vCounts):
+def decodeMorphDiffs(diffsBuff, diffsOffset, diffCount, mappingBuff, mappingOffset, mapCount, vertexCount, diffScale, diffOffset, scale):
+	#decodes one chunk of morph position diffs (12 byte records starting with a packed 10:10:10:2 position) and scatters them by their mapping into float XYZ for all vertexCount vertices:
+	useCount = mapCount - 1 if mapCount and diffCount % 2 != 0 else mapCount #an odd diff count has one padding entry at the end of the mapping
+	if useCount > diffCount:
+		raise IndexError("morph mapping has more entries than diffs")
+	if np is not None and useCount:
+		packed = np.ndarray((useCount, 1), dtype='<u4', buffer=diffsBuff, offset=diffsOffset, strides=(12, 4))
+		diffArray = (((packed >> np.array([0, 10, 20], dtype='<u4')) & 1023).astype(np.float64) - 511.00001) / 512.0 * np.array((diffScale[0], diffScale[1], diffScale[2])) + np.array((diffOffset[0], diffOffset[1], diffOffset[2]))
+		denseArray = np.zeros((vertexCount, 3))
+		denseArray[np.frombuffer(mappingBuff, dtype='<u2', count=useCount, offset=mappingOffset)] = diffArray
+		return (denseArray * scale).astype('<f4').tobytes()
+	denseList = [0.0] * (vertexCount * 3)
+	mapping = struct.unpack_from("<" + 'H'*useCount, mappingBuff, mappingOffset)
+	for m in range(useCount):
+		posDiff = struct.unpack_from('<I', diffsBuff, diffsOffset + 12 * m)[0]
+		for k in range(3):
+			denseList[mapping[m] * 3 + k] = (((((posDiff >> (10 * k)) & 0x3ff) - 511.00001) / 512.0) * diffScale[k] + diffOffset[k]) * scale
+	return struct.pack("<" + 'f'*len(denseList), *denseList)
+
+class MorphTargetDiffs:
+	#position diffs of a morphtarget, read from its diffs and mapping buffers and decoded per target and chunk only when they are fed. Both buffer files stay open until close()
+	def __init__(self, diffsFile, mappingFile, diffStarts, mappingStarts, diffCounts, mappingCounts, diffScales, diffOffsets, vCounts):
+		self.diffsFile = diffsFile
+		self.mappingFile = mappingFile
+		self.diffCounts = diffCounts
+		self.mappingCounts = mappingCounts
+		self.diffScales = diffScales
+		self.diffOffsets = diffOffsets
+		self.vCounts = vCounts
+		#first diff and mapping of every chunk of every target:
+		self.diffChunkStarts = [chunkStarts(start, counts) for start, counts in zip(diffStarts, diffCounts)]
+		self.mappingChunkStarts = [chunkStarts(start, counts) for start, counts in zip(mappingStarts, mappingCounts)]
+		self.diffsHandle = None
+		self.mappingHandle = None
+		
+	def __len__(self):
+		return len(self.diffCounts)
+		
+	def positions(self, t, c):
+		#float XYZ diffs of target t for all vertices of chunk (submesh) c, with 0's for all verts not having a diff
+		if self.diffsHandle is None:
+			self.diffsHandle = open(self.diffsFile, "rb")
+			self.mappingHandle = open(self.mappingFile, "rb")
+		diffCount = self.diffCounts[t][c]
+		mapCount = self.mappingCounts[t][c] * 2
+		self.diffsHandle.seek(self.diffChunkStarts[t][c] * 12)
+		diffsBuff = self.diffsHandle.read(diffCount * 12)
+		self.mappingHandle.seek(self.mappingChunkStarts[t][c] * 4)
+		mappingBuff = self.mappingHandle.read(mapCount * 2)
+		return decodeMorphDiffs(diffsBuff, 0, diffCount, mappingBuff, 0, mapCount, self.vCounts[c], self.diffScales[t], self.diffOffsets[t], meshScale / 2)
+		
+	def close(self):
+		if self.diffsHandle is not None:
+			self.diffsHandle.close()
+			self.mappingHandle.close()
+			self.diffsHandle = self.mappingHandle = None
+
+def chunkStarts(start, counts):
+	#running totals of counts, from start
+	starts = []
+	for count in counts:
+		starts.append(start)
+		start += count
+	return starts
+
+def getMorphTargetNames(data, export, names):
+	#names of the targets of a MorphTargetMesh export, by target index
+	targetNames = []
+	targets = CR2WReader(data, names, export.offset, export.dataEnd).get("targets")
+	if targets is not None:
+		for element in targets.elements():
+			targetName = ""
+			for prop in element:
+				if prop.name == "name" and prop.type == "CName":
+					nameIdx = struct.unpack_from("<H", data, prop.valueOffset)[0]
+					targetName = names[nameIdx] if nameIdx < len(names) else ""
+			targetNames.append(targetName)
+	return targetNames
+
+def getMorphTargetFilter():
+	#returns the morph target filter set by the -cp77morphs import option or the morphTargetFilter setting
+	if noesis.optWasInvoked("-cp77morphs"):
+		return noesis.optGetArg("-cp77morphs")
+	return morphTargetFilter
+
+def selectMorphTargets(filterString, numTargets, getTargetNames):
+	#returns the indices of the morph targets to import (1 to numTargets-1) matching a filter of indices, index ranges and names, or all of them if the filter is blank. getTargetNames is only called if the filter names a target
+	targets = range(1, numTargets)
+	if filterString.strip() == "":
+		return list(targets)
+	lowerNames = None
+	selected = set()
+	for item in filterString.split(","):
+		item = item.strip()
+		if item == "":
+			continue
+		bounds = item.split("-")
+		if len(bounds) == 2 and bounds[0].strip().isdigit() and bounds[1].strip().isdigit():
+			first, last = int(bounds[0]), int(bounds[1])
+			if first > last:
+				print ("Morph target filter: reading range", item, "as", str(last) + "-" + str(first))
+				first, last = last, first
+			selected.update(range(first, last + 1))
+		elif item.isdigit():
+			selected.add(int(item))
+		else:
+			if lowerNames is None:
+				lowerNames = [targetName.lower() for targetName in getTargetNames()]
+			if item.lower() in lowerNames:
+				selected.add(lowerNames.index(item.lower()))
+			else:
+				print ("Morph target filter: no target named", item)
+	return [t for t in targets if t in selected]
+
+def parseMorphs(mm, mMesh, indexToName, nameToIndex, submeshCount, vCounts, recorder=None):
 	numDiffsFlag = buildFlagFromNames(["numDiffs","Uint32"],nameToIndex,0)  
 	numDiffsMappingFlag = buildFlagFromNames(["numDiffsMapping","Uint32"],nameToIndex,0)  
 	numTargetsFlag = buildFlagFromNames(["numTargets","Uint32"],nameToIndex,0)  
@@ -978,26 +1901,27 @@ def parseMorphs(mm, mMesh, nameToIndex, submeshCount, vCounts):
 	numVertexDiffsInEachChunkFlag = buildFlagFromNames(["numVertexDiffsInEachChunk","array:array:Uint32"],nameToIndex,0)  
 	numVertexDiffsMappingInEachChunkFlag = buildFlagFromNames(["numVertexDiffsMappingInEachChunk","array:array:Uint32"],nameToIndex,0)  
 	diffsBufferFlag = buildFlagFromNames(["diffsBuffer","DataBuffer"],nameToIndex,0)  
-	if findFlag(mm, numDiffsFlag, mMesh.dataSize, 0):
+	mmIndex = CR2WPropertyIndex(mm, indexToName)
+	if mmIndex.find(mm, numDiffsFlag):
 		numDiffs = readUIntAt(mm, mm.tell()+8)
-	if findFlag(mm, numDiffsMappingFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, numDiffsMappingFlag):
 		numDiffsMapping = readUIntAt(mm, mm.tell()+8)
-	if findFlag(mm, numTargetsFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, numTargetsFlag):
 		numTargets = readUIntAt(mm, mm.tell()+8)
 		
-	if findFlag(mm, targetStartsDiffsFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, targetStartsDiffsFlag):
 		numTargetStartsDiffs = readUIntAt(mm, mm.tell()+8)
 		mm.seek(12,1)
 		targetStartsDiffs = []
 		for j in range(numTargetStartsDiffs):
 			targetStartsDiffs.append(mm.readUInt())
-	if findFlag(mm, targetStartsDiffsMappingFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, targetStartsDiffsMappingFlag):
 		numTargetStartsDiffsMappings = readUIntAt(mm, mm.tell()+8)
 		mm.seek(12,1)
 		targetStartsDiffsMappings = []
 		for j in range(numTargetStartsDiffsMappings):
 			targetStartsDiffsMappings.append(mm.readUInt())
-	if findFlag(mm, targetPositionDiffScaleFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, targetPositionDiffScaleFlag):
 		numTargetPositionDiffScales = readUIntAt(mm, mm.tell()+8)
 		mm.seek(12,1)
 		targetPositionDiffScales = []
@@ -1006,7 +1930,7 @@ def parseMorphs(mm, mMesh, nameToIndex, submeshCount, vCounts):
 			targetPositionDiffScales.append(NoeVec3(((readFloatAt(mm, pos+9)), (readFloatAt(mm, pos+21)), (readFloatAt(mm, pos+33)))))
 			mm.seek(pos+51)
 			
-	if findFlag(mm, targetPositionDiffOffsetFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, targetPositionDiffOffsetFlag):
 		numTargetPositionDiffOffsets = readUIntAt(mm, mm.tell()+8)
 		mm.seek(12,1)
 		targetPositionDiffOffsets = []
@@ -1014,7 +1938,7 @@ def parseMorphs(mm, mMesh, nameToIndex, submeshCount, vCounts):
 			pos = mm.tell()
 			targetPositionDiffOffsets.append(NoeVec3((readFloatAt(mm, pos+9), readFloatAt(mm, pos+21), (readFloatAt(mm, pos+33)))))
 			mm.seek(pos+51)
-	if findFlag(mm, numVertexDiffsInEachChunkFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, numVertexDiffsInEachChunkFlag):
 		numElementsVertexDiffsInEachChunk = readUIntAt(mm, mm.tell()+8)
 		mm.seek(12,1)
 		numVertexDiffsInEachChunk = []
@@ -1024,7 +1948,7 @@ def parseMorphs(mm, mMesh, nameToIndex, submeshCount, vCounts):
 			for c in range(count):
 				subArray.append(mm.readUInt())
 			numVertexDiffsInEachChunk.append(subArray)
-	if findFlag(mm, numVertexDiffsMappingInEachChunkFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, numVertexDiffsMappingInEachChunkFlag):
 		numElementsVertexDiffsMappingsInEachChunk = readUIntAt(mm, mm.tell()+8)
 		mm.seek(12,1)
 		numVertexDiffsMappingsInEachChunk = []
@@ -1034,108 +1958,22 @@ def parseMorphs(mm, mMesh, nameToIndex, submeshCount, vCounts):
 			for c in range(count):
 				subArray.append(mm.readUInt())
 			numVertexDiffsMappingsInEachChunk.append(subArray)
-	if findFlag(mm, diffsBufferFlag, mMesh.dataSize, 0):
+	if mmIndex.find(mm, diffsBufferFlag):
 		diffsBuffer = readUShortAt(mm, mm.tell()+8) - 1
 		mappingBuffer = readUShortAt(mm, mm.tell()+20) - 1
 	mm.seek(0)
 	
 	diffsFile = rapi.getInputName().replace(".morphtarget", ".morphtarget." + str(diffsBuffer) + ".buffer")
-	
-	if rapi.checkFileExists(diffsFile):
-		diffsBuff = rapi.loadIntoByteArray(diffsFile)
-		diffsStream = NoeBitStream(diffsBuff)
-		allPosDiffs = []
-		allNrmDiffs = []
-		allTanDiffs = []
-		for t in range(numTargets):
-			targetPosDiffs = []
-			targetNrmDiffs = []
-			targetTanDiffs = []
-			diffsStream.seek(targetStartsDiffs[t] * 12)
-				
-			for c in range(len(numVertexDiffsInEachChunk[t])):
-				chunkPosDiffs = []
-				chunkNrmDiffs = []
-				chunkTanDiffs = []
-				for d in range(numVertexDiffsInEachChunk[t][c]):
-					pos = diffsStream.tell()
-					posDiff = diffsStream.readUInt()
-					pdX = posDiff & 0x3ff
-					pdY = (posDiff >> 10) & 0x3ff
-					pdZ = (posDiff >> 20) & 0x3ff
-					chunkPosDiffs.append(NoeVec3((((pdX - 511.00001) / 512.0) * targetPositionDiffScales[t][0] + targetPositionDiffOffsets[t][0], \
-					((pdY - 511.00001) / 512.0) * targetPositionDiffScales[t][1] + targetPositionDiffOffsets[t][1], \
-					((pdZ - 511.00001) / 512.0) * targetPositionDiffScales[t][2] + targetPositionDiffOffsets[t][2])))
-					#if t == 1 and c == 0 and d <= 3:
-					#	print (chunkPosDiffs[d], diffsStream.tell(), t, d)
-						#print ("offs", targetPositionDiffOffsets[t])
-						#print ("scale", targetPositionDiffScales[t])
-					#pdX = ((diffsStream.readBits(10) - 511) / 512.0)
-					#pdY = ((diffsStream.readBits(10) - 511) / 512.0)
-					#pdZ = ((diffsStream.readBits(10) - 511) / 512.0)
-					#diffsStream.readBits(2)
-					#chunkPosDiffs.append(NoeVec3((pdX, pdZ, -pdY)))
-					
-					ndX = ((diffsStream.readBits(10) - 511.00001) / 512.0)
-					ndY = ((diffsStream.readBits(10) - 511.00001) / 512.0)
-					ndZ = ((diffsStream.readBits(10) - 511.00001) / 512.0)
-					diffsStream.readBits(2)
-					chunkNrmDiffs.append(NoeVec3((ndX, ndY, ndZ))) #chunkNrmDiffs.append(NoeVec3((ndX, ndZ, -ndY)))
-					'''tdX = ((diffsStream.readBits(10) - 511) / 512.0)
-					tdY = ((diffsStream.readBits(10) - 511) / 512.0)
-					tdZ = ((diffsStream.readBits(10) - 511) / 512.0)
-					diffsStream.readBits(2)
-					chunkTanDiffs.append(NoeVec3((tdX, tdZ, -tdY)))'''
-					diffsStream.seek(pos+12)
-					
-				targetPosDiffs.append(chunkPosDiffs)
-				targetNrmDiffs.append(chunkNrmDiffs)
-				targetTanDiffs.append(chunkTanDiffs)
-			allPosDiffs.append(targetPosDiffs)
-			allNrmDiffs.append(targetNrmDiffs)
-			allTanDiffs.append(targetTanDiffs)
-	
 	mappingFile = rapi.getInputName().replace(".morphtarget", ".morphtarget." + str(mappingBuffer) + ".buffer")
-	allMaps = []
-	if rapi.checkFileExists(mappingFile):
-		mappingBuff = rapi.loadIntoByteArray(mappingFile)
-		mappingStream = NoeBitStream(mappingBuff)
-		for t in range(numTargets):
-			targetMaps = []
-			mappingStream.seek(targetStartsDiffsMappings[t] * 4)
-			#print (t, "seeked to mappingStream", mappingStream.tell())
-			#if t > 0:
-			#	for eye in range(0, t):
-			#		mappingStream.seek(numVertexDiffsMappingsInEachChunk[t][eye] * 4, 1)
-				
-			for c in range(len(numVertexDiffsMappingsInEachChunk[t])):				
-				chunkMaps = []
-				for d in range(numVertexDiffsMappingsInEachChunk[t][c] * 2):
-					chunkMaps.append(mappingStream.readUShort())
-				targetMaps.append(chunkMaps)
-			allMaps.append(targetMaps)
-	
-	#build list of diffs [vertexCount] long, with list[X] being diff[X] (if X is an index in the maps), and 0's for all verts not having a diff
-	allDiffsList = []
-	if allMaps and allPosDiffs:
-		for t in range(numTargets):
-			targDiffsList = []
-			#print ("using scale:", targetPositionDiffScales[t])
-			for c in range(len(numVertexDiffsInEachChunk[t])):
-				#print ("morphtarget", t, "chunk", c, "diffCount", len(allMaps[t][c]))
-				
-				diffsList = [NoeVec3((0,0,0)) for k in range(vCounts[c])]
-				nrmDiffsList = [NoeVec3((0,0,0)) for k in range(vCounts[c])]
-				for m, map in enumerate(allMaps[t][c]):
-					if m == len(allMaps[t][c])-1 and len(allPosDiffs[t][c]) % 2 != 0:
-						break
-					diffsList[map] = ((allPosDiffs[t][c][m])) 
-					nrmDiffsList[map] = allNrmDiffs[t][c][m]  
-					
-				targDiffsList.append((diffsList, nrmDiffsList))
-			allDiffsList.append(targDiffsList)
-			
-	return allDiffsList
+	
+	if recorder is not None:
+		recorder.stampFile(diffsFile)
+		recorder.stampFile(mappingFile)
+	if not (rapi.checkFileExists(diffsFile) and rapi.checkFileExists(mappingFile)):
+		return None
+	return MorphTargetDiffs(diffsFile, mappingFile, targetStartsDiffs, targetStartsDiffsMappings, numVertexDiffsInEachChunk, numVertexDiffsMappingsInEachChunk, 
+		targetPositionDiffScales, targetPositionDiffOffsets, vCounts)
+
 
 bodyTypes = {
     "ma": "man_base",
@@ -1153,7 +1991,7 @@ bodyTypes = {
     "wt": "woman_teen"
 }
 
-def getBaseRig(bodyType, basegameDir, deformRig = False):
+def getBaseRig(bodyType, basegameDir, deformRig = False, recorder=None):
 	try:
 		bodyType = bodyTypes[bodyType]
 	except:
@@ -1165,27 +2003,84 @@ def getBaseRig(bodyType, basegameDir, deformRig = False):
 	
 	if deformRig:
 		rigD = extractedDir + basegameDir + "\\base\\characters\\base_entities\\" + bodyType + "\\deformations_rigs\\" + bodyType + "_deformations.rig"
+		if recorder is not None:
+			recorder.stampFile(rigD)
 		if rapi.checkFileExists(rigD) == False and subType != "base":
-			rigD = getBaseRig(g+"_base", basegameDir, True)
+			rigD = getBaseRig(g+"_base", basegameDir, True, recorder)
 		return rigD
 	else:
 		rigF = extractedDir + basegameDir + "\\base\\characters\\base_entities\\" + bodyType + "\\" + bodyType + ".rig" 
+		if recorder is not None:
+			recorder.stampFile(rigF)
 		if rapi.checkFileExists(rigF) == False and subType != "base":
-			rigF = getBaseRig(g+"_base", basegameDir)
+			rigF = getBaseRig(g+"_base", basegameDir, recorder=recorder)
 		return rigF
 
 
 localMat = NoeMat43(((0, 1, 0), (0, 0, -1), (-1, 0, 0), (0, 0, 0))) #NoeMat43(((0, 0, -1), (1, 0, 0), (0, -1, 0), (0, 0, 0)))
 globalMat = NoeMat43(((-1, 0, 0), (0,  0, 1), ( 0, 1, 0), (0, 0, 0))) 
 
-def LoadRig(br, meshBones, bindMatrices, type=0):
+class BoneIndex:
+	#name lookups over one skeleton, built once: name to index, name to bone and the parent index of each bone
+	def __init__(self, names, bones=None):
+		self.names = names
+		self.bones = bones
+		self.indices = {}
+		for i, name in enumerate(names):
+			self.indices.setdefault(name, i) #first match, like list.index
+		self.parents = None
+		if bones is not None:
+			self.parents = [self.indices.get(bone.parentName, -1) for bone in bones]
+		
+	@classmethod
+	def fromBones(cls, bones):
+		return cls([bone.name for bone in bones], bones)
+		
+	def __contains__(self, name):
+		return name in self.indices
+		
+	def __len__(self):
+		return len(self.names)
+		
+	def find(self, name):
+		return self.indices.get(name, -1)
+		
+	def bone(self, name):
+		return self.bones[self.indices[name]]
+
+PARSEDRIG = namedtuple("PARSEDRIG", "boneNames parIds transforms") #transforms are (translation, rotation, scale) float tuples of the pose the rig is built from
+
+qsTransformOffsets = tuple(59 * k + o for k in range(3) for o in (18, 30, 42, 54)) #X, Y, Z and W floats of the Translation, Rotation and Scale of a serialized QsTransform
+qsTransformSize = 180
+tPoseOffsets = tuple(range(0, 48, 4)) #translation, rotation and scale of a T-pose transform, each 4 floats
+tPoseSize = 48
+
+def unpackTransforms(data, offset, count, floatOffsets, size):
+	#decodes count records of twelve floats (translation, rotation and scale XYZW) into (translation, rotation, scale) tuples in one pass
+	if np is not None:
+		byteIndices = (np.array(floatOffsets)[:,None] + np.arange(4)).ravel()
+		records = np.frombuffer(data, dtype=np.uint8, count=count * size, offset=offset).reshape(count, size)
+		rows = np.ascontiguousarray(records[:,byteIndices]).view('<f4').tolist()
+	else:
+		recordFormat = "<"; pos = 0
+		for floatOffset in floatOffsets:
+			recordFormat += str(floatOffset - pos) + "xf"
+			pos = floatOffset + 4
+		recordFormat += str(size - pos) + "x"
+		rows = struct.iter_unpack(recordFormat, bytes(data[offset:offset + count * size]))
+	return [(tuple(row[0:3]), tuple(row[4:8]), tuple(row[8:11])) for row in rows]
+
+def parseRig(br, type=0):
+	#reads the bone names, parent ids and bind pose transforms of a rig file
 	indexToName, nameToIndex, maxOffset, EXPORTS, exportNames, buffers = ParseHeader(br)
 	checkPoint = br.tell()
+	brIndex = CR2WPropertyIndex(br, indexToName, EXPORTS)
+	data = br.getBuffer()
 	
 	# Read bone names
 	bNameFlag = buildFlagFromNames(["boneNames","array:CName"],nameToIndex,0)
 	rigBones = []
-	if findFlag(br, bNameFlag, maxOffset, 0):
+	if brIndex.find(br, bNameFlag):
 		br.seek(8,1)
 		boneC = br.readInt()
 		for i in range(boneC):
@@ -1195,77 +2090,58 @@ def LoadRig(br, meshBones, bindMatrices, type=0):
 	# Get A-poseLS bones
 	if "aPoseLS" in indexToName:
 		aposeLSFlag = buildFlagFromNames(["aPoseLS","array:QsTransform"],nameToIndex,0)
-		if findFlag(br, aposeLSFlag, maxOffset, 0):
+		if brIndex.find(br, aposeLSFlag):
 			br.seek(8,1)
 			apBoneCLS = br.readUInt()
-			aPosesLS = []
-			for i in range(apBoneCLS):
-				pos = br.tell()
-				boneTrans = NoeVec4((readFloatAt(br, pos+18), readFloatAt(br, pos+30), readFloatAt(br, pos+42), readFloatAt(br, pos+54))).toVec3()
-				pos += 59
-				boneRot = NoeQuat((readFloatAt(br, pos+18), readFloatAt(br, pos+30), readFloatAt(br, pos+42), readFloatAt(br, pos+54))).transpose()
-				pos += 59
-				boneScale = NoeVec4((readFloatAt(br, pos+18), readFloatAt(br, pos+30), readFloatAt(br, pos+42), readFloatAt(br, pos+54))).toVec3()
-				aPosesLS.append((boneTrans, boneRot, boneScale))
-				br.seek(pos + 62)
+			aPosesLS = unpackTransforms(data, br.tell(), apBoneCLS, qsTransformOffsets, qsTransformSize)
+			type = 1
 		br.seek(checkPoint)
-		type = 1
 	
-	# Get A-poseMS bones
-	if "aPoseMS" in indexToName:
+	# Get A-poseMS bones (only used when the rig has no A-poseLS)
+	if "aPoseMS" in indexToName and type != 1:
 		aposeMSFlag = buildFlagFromNames(["aPoseMS","array:QsTransform"],nameToIndex,0)
-		if findFlag(br, aposeLSFlag, maxOffset, 0):
+		if brIndex.find(br, aposeMSFlag):
 			br.seek(8,1)
 			apBoneCMS = br.readInt()
-			aPosesMS = []
-			for i in range(apBoneCMS):
-				pos = br.tell()
-				boneTrans = NoeVec4((readFloatAt(br, pos+18), readFloatAt(br, pos+30), readFloatAt(br, pos+42), readFloatAt(br, pos+54))).toVec3()
-				pos += 59
-				boneRot = NoeQuat((readFloatAt(br, pos+18), readFloatAt(br, pos+30), readFloatAt(br, pos+42), readFloatAt(br, pos+54))).transpose()
-				pos += 59
-				boneScale = NoeVec4((readFloatAt(br, pos+18), readFloatAt(br, pos+30), readFloatAt(br, pos+42), readFloatAt(br, pos+54))).toVec3()
-				aPosesMS.append((boneTrans, boneRot, boneScale))
-				br.seek(pos + 62)
+			aPosesMS = unpackTransforms(data, br.tell(), apBoneCMS, qsTransformOffsets, qsTransformSize)
+			type = 2
 		br.seek(checkPoint)
-		type = 2
 	
 	# Parenting info
 	findFlag(br, b'\xFF\xFF\x00\x00', br.getSize(), 0)
-	parIds = []
-	for b in range(boneC):
-		parIds.append(br.readShort())	
+	parIds = list(struct.unpack_from("<" + 'h'*boneC, data, br.tell()))
 	
 	#T-pose positions
-	tPoses = []
-	for b in range(boneC):
-		boneName = rigBones[b]
-		bonePos = NoeVec3.fromBytes(br.readBytes(12)); br.seek(4,1)
-		boneRot = NoeQuat.fromBytes(br.readBytes(16)).transpose()
-		boneScl = NoeVec3.fromBytes(br.readBytes(12)); br.seek(4,1)
-		tPoses.append((bonePos, boneRot, boneScl))
+	tPoses = unpackTransforms(data, br.tell() + 2 * boneC, boneC, tPoseOffsets, tPoseSize)
 	
 	bnMatrices = tPoses
 	if type == 1:
-		bnMatrices = aPosesMS
-	elif type == 2:
 		bnMatrices = aPosesLS
+	elif type == 2:
+		bnMatrices = aPosesMS
+	return PARSEDRIG(rigBones, parIds, bnMatrices)
+
+def LoadRig(rig, meshBones, bindMatrices):
+	#builds the bones of a parsed rig, parenting them to the mesh bind matrices where the mesh has the parent bone
+	rigBones, parIds, bnMatrices = rig
 	
 	#Create Rig:
 	bones = []
-	for b in range(boneC):
-		matrix = bnMatrices[b][1].toMat43() #rotation
-		matrix[3] = (matrix[3] + bnMatrices[b][0]) * meshScale #translation
+	rigIndex = BoneIndex(rigBones)
+	meshIndex = BoneIndex(meshBones)
+	for b in range(len(rigBones)):
+		matrix = NoeQuat(bnMatrices[b][1]).transpose().toMat43() #rotation
+		matrix[3] = (matrix[3] + NoeVec3(bnMatrices[b][0])) * meshScale #translation
 		matrix *= NoeMat43((NoeVec3((bnMatrices[b][2][0],0,0)), NoeVec3((0,bnMatrices[b][2][1],0)), NoeVec3((0,0,bnMatrices[b][2][2])), NoeVec3((0,0,0)))) #scale
 		try:
 			if b:
-				if bindMatrices and bones[parIds[b]].name in meshBones:
-					pmat = NoeMat44(bindMatrices[meshBones.index(bones[parIds[b]].name)]).toMat43().inverse()
+				if bindMatrices and bones[parIds[b]].name in meshIndex:
+					pmat = NoeMat44(bindMatrices[meshIndex.find(bones[parIds[b]].name)]).toMat43().inverse()
 					pmat[3] *= meshScale
 					matrix *= pmat #multiply by mesh parent
 				else:
 					matrix = matrix * bones[parIds[b]].getMatrix() #multiply by rig parent
-				bones.append(NoeBone(b, rigBones[b], matrix, bones[parIds[b]].name, rigBones.index(bones[parIds[b]].name)))
+				bones.append(NoeBone(b, rigBones[b], matrix, bones[parIds[b]].name, rigIndex.find(bones[parIds[b]].name)))
 			else:
 				bones.append(NoeBone(b, rigBones[b], matrix, None, -1))
 		except:
@@ -1282,6 +2158,104 @@ def LoadRig(br, meshBones, bindMatrices, type=0):
 		
 	# Return bones and name list
 	return [bones, rigBones]	
+
+def mergeRigBones(bones, boneNames, ogIndex, rigIndex):
+	#merges a rig skeleton into the current skeleton as a union of both, keyed by bone name. Rig bones are only kept where they link mesh bones together
+	boneIndex = BoneIndex(boneNames, bones)
+	newBones = []
+	newBoneNames = set()
+	for bName in dict.fromkeys(boneNames + rigIndex.names): #unique names in order
+		newBone = None
+		if bName in ogIndex and bName in rigIndex:
+			newBone = ogIndex.bone(bName)
+			if newBone.parentName == None:
+				newBone.parentName = rigIndex.bone(bName).parentName
+		elif bName in boneIndex:
+			newBone = boneIndex.bone(bName)
+		
+		if newBone is not None:
+			if newBone.parentName in rigIndex and newBone.parentName not in newBoneNames and newBone.parentName not in boneIndex: #add only the rigbones bones needed to link meshbones together
+				boneChain = []
+				parentBone = rigIndex.bone(newBone.parentName)
+				while parentBone.name not in boneIndex and parentBone.name not in newBoneNames:
+					boneChain.append(parentBone)
+					if parentBone.parentName is not None and parentBone.parentName != "":
+						parentBone = rigIndex.bone(parentBone.parentName)
+					else: break
+				if bConnectRigToRoot == True or boneChain[-1].parentName in ogIndex:
+					for bn in boneChain:
+						bn.index = len(newBones)
+						newBones.append(bn)
+						newBoneNames.add(bn.name)
+			newBone.index = len(newBones)
+			newBones.append(newBone)
+			newBoneNames.add(newBone.name)
+	return newBones, [bone.name for bone in newBones]
+		
+class ParsedRigCache(DiskCache):
+	#parsed rig files keyed by rig path and modification time, the most recently used ones are kept in memory and optionally on disk
+	extension = ".rigcache"
+	
+	def __init__(self, folder, maxSize, memoryCount):
+		DiskCache.__init__(self, folder, maxSize)
+		self.memoryCount = memoryCount
+		self.memory = OrderedDict()
+		
+	def makeKey(self, path, stamp):
+		hasher = hashlib.blake2b(digest_size=20)
+		hasher.update(repr((pluginVersion, getPluginStamp(), os.path.abspath(path), stamp)).encode())
+		return hasher.hexdigest()
+		
+	def load(self, path):
+		#returns the parsed rig at path, parsing the file only if it is not cached or changed since it was cached
+		stamp = getFileStamp(path)
+		key = self.makeKey(path, stamp)
+		rig = self.memory.get(key)
+		if rig is not None:
+			self.memory.move_to_end(key)
+			return rig
+		if self.folder is not None:
+			cachedBytes = self.get(key)
+			if cachedBytes is not None:
+				try:
+					rig = PARSEDRIG(*pickle.loads(cachedBytes))
+				except Exception:
+					rig = None
+		if rig is None:
+			rig = parseRig(NoeBitStream(rapi.loadIntoByteArray(path)))
+			if self.folder is not None and stamp is not None:
+				try:
+					self.put(key, pickle.dumps(tuple(rig), protocol=pickle.HIGHEST_PROTOCOL))
+				except Exception as e:
+					print ("Could not write to the rig cache:", e)
+		if self.memoryCount > 0 and stamp is not None:
+			self.memory[key] = rig
+			while len(self.memory) > self.memoryCount:
+				self.memory.popitem(last=False)
+		return rig
+		
+rigCache = None
+
+def getRigCache():
+	#returns the shared ParsedRigCache, or None if rigs are not cached
+	global rigCache, bRigDiskCache
+	if rigCache is None and (rigCacheCount > 0 or bRigDiskCache):
+		folder = None
+		if bRigDiskCache:
+			try:
+				folder = getCacheFolder("rigs")
+			except Exception as e:
+				print ("Rig disk cache is disabled:", e)
+				bRigDiskCache = False
+		rigCache = ParsedRigCache(folder, rigCacheMB * 1048576, rigCacheCount)
+	return rigCache
+
+def loadParsedRig(path):
+	#returns the parsed rig file at path, from the rig cache if it is enabled
+	cache = getRigCache()
+	if cache is not None:
+		return cache.load(path)
+	return parseRig(NoeBitStream(rapi.loadIntoByteArray(path)))
 	
 '''////////////////////////////////////////////////////////////////////////////////// MESH IMPORT //////////////////////////////////////////////////////////////////////////////////'''
 
@@ -1297,6 +2271,133 @@ def findNextOfUInt(bitStream, UIntToFind):
 	bitStream.seek(originalPosition)
 	return finalPosition
 
+def getFileStamp(path):
+	#returns the modification time and size of a file or folder, or None if it does not exist
+	try:
+		stat = os.stat(path)
+	except (OSError, TypeError, ValueError):
+		return None
+	return (stat.st_mtime_ns, stat.st_size)
+
+def getPluginStamp():
+	#getFileStamp of this plugin file, or None if Noesis did not set __file__
+	try:
+		return getFileStamp(__file__)
+	except NameError:
+		return None
+
+
+class RapiRecorder:
+	#passed to decodeModel, which makes its rapi calls through it: forwards every call, logs the rpg* calls that succeeded (and every context and model, which mark where each LOD starts and ends) and stamps every file that was looked up or read
+	def __init__(self, rapiModule):
+		self.rapiModule = rapiModule
+		self.calls = []
+		self.files = {}
+		self.bCacheable = True
+		
+	def __getattr__(self, name):
+		func = getattr(self.rapiModule, name)
+		if name in ("rpgCreateContext", "rpgConstructModelAndSort"):
+			def recordBoundary(*args):
+				self.calls.append((name, ())) #also logged if it fails, decodeModel then uses an empty NoeModel
+				return func(*args)
+			return recordBoundary
+		if name.startswith("rpg"):
+			def recordCall(*args):
+				result = func(*args)
+				self.calls.append((name, tuple(bytes(arg) if isinstance(arg, (bytearray, memoryview)) else arg for arg in args)))
+				return result
+			return recordCall
+		if name in ("checkFileExists", "loadIntoByteArray"):
+			def stampedCall(path, *args):
+				self.stampFile(path)
+				return func(path, *args)
+			return stampedCall
+		if name == "loadPairedFileOptional":
+			self.bCacheable = False #depends on what the user picks
+		return func
+		
+	def stampFile(self, path):
+		#for the helpers of decodeModel, which look up files through rapi itself
+		self.files[path] = getFileStamp(path)
+		
+
+class DecodedMeshCache(DiskCache):
+	#on-disk cache of the rpg* calls and bones of decoded meshes, keyed by a hash of the file, the plugin version and the import options
+	extension = ".meshcache"
+	
+	def makeKey(self, data):
+		inputName = rapi.getInputName()
+		options = (pluginVersion, getPluginStamp(), inputName, extractedDir, meshScale, bHighestLODOnly, bAutoDetectRig, bParentToRootIfNoParent, bReadTangents, bImportGarmentMesh,
+			bImportExportDamageMeshes, bImportMorphtargets, bVertexColors, bConnectRigToRoot, bFlipImage, bCompress, noesis.optWasInvoked("-cp77optimize"), getMorphTargetFilter())
+		hasher = hashlib.blake2b(digest_size=20)
+		hasher.update(repr(options).encode())
+		hasher.update(data)
+		return hasher.hexdigest()
+		
+	def listRigFiles(self):
+		#rig files next to the mesh, which decodeModel picks up with bAutoDetectRig. Only their names are compared, the rigs that were read are stamped
+		try:
+			return sorted(fileName for fileName in os.listdir(os.path.dirname(rapi.getInputName())) if fileName.endswith(".rig"))
+		except OSError:
+			return []
+		
+	def load(self, key):
+		cachedBytes = self.get(key)
+		if cachedBytes is None:
+			return None
+		try:
+			record = pickle.loads(cachedBytes)
+		except Exception:
+			return None
+		for path, stamp in record["files"].items():
+			if getFileStamp(path) != stamp:
+				return None
+		if record["rigFiles"] != self.listRigFiles():
+			return None
+		return record
+		
+	def save(self, key, recorder, models):
+		if len(models) != sum(1 for name, args in recorder.calls if name == "rpgConstructModelAndSort"):
+			return #a model was not built from the rpg context, it could not be replayed
+		record = {"calls": recorder.calls, "bones": [getattr(mdl, "bones", None) or None for mdl in models], "files": recorder.files, "rigFiles": self.listRigFiles()}
+		try:
+			self.put(key, pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+		except Exception as e:
+			print ("Could not write to the mesh cache:", e)
+			
+	def replay(self, record, mdlList):
+		#rebuilds the models (one per LOD) by repeating the rpg* calls of the original import
+		ctx = None
+		models = []
+		for name, args in record["calls"]:
+			if name == "rpgCreateContext":
+				ctx = rapi.rpgCreateContext()
+			elif name == "rpgConstructModelAndSort":
+				try:
+					models.append(rapi.rpgConstructModelAndSort())
+				except:
+					models.append(NoeModel())
+			else:
+				getattr(rapi, name)(*args)
+		for mdl, bones in zip(models, record["bones"]):
+			if bones:
+				mdl.setBones(bones)
+			mdlList.append(mdl)
+		
+meshCache = None
+
+def getMeshCache():
+	#returns the shared DecodedMeshCache, or None if it is disabled or its folder is unavailable
+	global meshCache, bMeshCache
+	if bMeshCache and meshCache is None:
+		try:
+			meshCache = DecodedMeshCache(getCacheFolder("meshes"), meshCacheMB * 1048576)
+		except Exception as e:
+			print ("Mesh cache is disabled:", e)
+			bMeshCache = False
+	return meshCache if bMeshCache else None
+
 def LoadModel(data, mdlList):
 	global extractedDir
 	
@@ -1313,9 +2414,34 @@ def LoadModel(data, mdlList):
 		if os.path.isdir(extractedPath):
 			extractedDir = extractedPath
 			
-	ctx = rapi.rpgCreateContext()	
+	cache = None if bLoadRigFile else getMeshCache() #a picked rig file is not part of the key
+	if cache is None:
+		result = decodeModel(data, mdlList)
+	else:
+		key = cache.makeKey(data)
+		record = cache.load(key)
+		if record is not None:
+			print ("Loaded", os.path.basename(rapi.getInputName()), "from the mesh cache")
+			cache.replay(record, mdlList)
+			result = 1
+		else:
+			modelCount = len(mdlList)
+			recorder = RapiRecorder(rapi)
+			result = decodeModel(data, mdlList, recorder)
+			if result and recorder.bCacheable and len(mdlList) > modelCount:
+				cache.save(key, recorder, mdlList[modelCount:])
+	
+	if result and mdlList and mdlList[0].meshes and not rapi.noesisIsExporting() and mdlList[0].meshes[0].name.find("_") != -1:
+		print ("WARNING: Mesh split detected!\nUse the advanced option '-fbxmeshmerge' when exporting this model to FBX.")
+	return result
+	
+def decodeModel(data, mdlList, recorder=None):
+	#decodes the mesh or morphtarget file into models (one per LOD) appended to mdlList. With a RapiRecorder, every rapi call goes through it and it is passed to the helpers that look up files
+	meshRapi = rapi if recorder is None else recorder
+	ctx = meshRapi.rpgCreateContext()	
 	#rapi.parseInstanceOptions("-killdupfaces")
 	bs = NoeBitStream(data)
+	source = CR2WSource(data)
 	
 	foundOffset = findNextOfUInt(bs, 1263681867)
 	if foundOffset != -1:
@@ -1328,26 +2454,25 @@ def LoadModel(data, mdlList):
 	#parse names and CR2W header:
 	indexToName, nameToIndex, maxOffset, EXPORTS, exportNames, buffers = ParseHeader(bs)
 	checkPoint = bs.tell()
+	source.attachBuffers(buffers)
 	
-	bIsMorphtarget = True if os.path.splitext(rapi.getInputName())[1] == ".morphtarget" else False
+	bIsMorphtarget = True if os.path.splitext(meshRapi.getInputName())[1] == ".morphtarget" else False
 	bRiggedModel = True if "boneRigMatrices" in indexToName else False
 
 	#open bitstreams of the main mesh classes inside the file:
 	if bIsMorphtarget:
 		ext = "morphtarget"
 		cMesh = EXPORTS[exportNames.index("MorphTargetMesh")]
-		skipFlag = buildFlagFromNames(["targets","array:MorphTargetMeshEntry"],nameToIndex,0)  #this property is sometimes over 1MB in size and must be skipped when scanning for flags, else execution takes 9-10x longer:
-		rapi.rpgSetOption(noesis.RPGOPT_MORPH_RELATIVEPOSITIONS, 1)
-		rapi.rpgSetOption(noesis.RPGOPT_MORPH_RELATIVENORMALS, 1)
+		meshRapi.rpgSetOption(noesis.RPGOPT_MORPH_RELATIVEPOSITIONS, 1)
+		meshRapi.rpgSetOption(noesis.RPGOPT_MORPH_RELATIVENORMALS, 1)
 	else:
 		ext = "mesh"
 		cMesh = EXPORTS[exportNames.index("CMesh")]
-		skipFlag = buildFlagFromNames(["topology","array:rendTopologyData"],nameToIndex,0) 
 		
 
 	rMesh = EXPORTS[exportNames.index("rendRenderMeshBlob")]
-	bs.seek(rMesh.offset)
-	rm = NoeBitStream(bs.readBytes(rMesh.dataSize))
+	rm = source.exportStream(rMesh)
+	rmIndex = CR2WPropertyIndex(rm, indexToName, data=source.exportSlice(rMesh)) #index the property headers once instead of rescanning the blob for every flag
 	
 	if "garmentMeshParamGarment" in exportNames:
 		gMesh = EXPORTS[exportNames.index("garmentMeshParamGarment")] 
@@ -1362,33 +2487,30 @@ def LoadModel(data, mdlList):
 		if EXPORTS[i].name == "CMesh":
 			meshCount += 1
 		if EXPORTS[i].name == "rendRenderMeshBlob" and bufferNo == -1:
-			findFlag(rm, uncompressedDataFlag, rMesh.dataSize, skipFlag)
+			rmIndex.find(rm, uncompressedDataFlag)
 			rm.seek(4,1)
 			bufferSize = rm.readUInt()
 			rm.seek(4,1)
 			if bufferSize > 8:
 				bufferStart = rm.tell()
-				bfs = NoeBitStream(rm.readBytes(rm.getSize()-rm.tell()))
-				rm.seek(0)
-				rm = NoeBitStream(rm.readBytes(bufferStart))
+				bfs = source.stream(rMesh.offset + bufferStart, rm.getSize() - bufferStart)
+				rm = source.stream(rMesh.offset, bufferStart)
 			else:
 				bufferNo = readUShortAt(bs, EXPORTS[i].dataEnd-6) - 1
 			rm.seek(0)
 	#print(meshCount, "BufferNo:", bufferNo, EXPORTS[i].dataEnd-6)
 	
-	bs.seek(cMesh.offset)
-	cm = NoeBitStream(bs.readBytes(cMesh.dataSize))
+	cm = source.exportStream(cMesh)
 	
 	if "rendRenderMorphTargetMeshBlob" in exportNames:
 		mMesh = EXPORTS[exportNames.index("rendRenderMorphTargetMeshBlob")] 
-		bs.seek(mMesh.offset)
-		mm = NoeBitStream(bs.readBytes(mMesh.dataSize))
+		mm = source.exportStream(mMesh)
 		
 
 	
 	#Quantization info
 	quantScaleFlag = buildFlagFromNames(["quantizationScale","Vector4"],nameToIndex,0)
-	if not findFlag(rm, quantScaleFlag, rMesh.dataSize, skipFlag):
+	if not rmIndex.find(rm, quantScaleFlag):
 		print("No quantization scale found")
 		return 0
 	else:
@@ -1400,7 +2522,7 @@ def LoadModel(data, mdlList):
 	rm.seek(0)
 	
 	quantOffFlag = buildFlagFromNames(["quantizationOffset","Vector4"],nameToIndex,0)
-	if not findFlag(rm, quantOffFlag, rMesh.dataSize, skipFlag):
+	if not rmIndex.find(rm, quantOffFlag):
 		print("No quantization offset found")
 		return 0
 	else:
@@ -1417,7 +2539,7 @@ def LoadModel(data, mdlList):
 	vertDefs = []
 	
 	posFlag = buildFlagFromNames(["numVertices","Uint16"],nameToIndex,0)
-	while findFlag(rm, posFlag, rMesh.dataSize, skipFlag):
+	while rmIndex.find(rm, posFlag):
 		rm.seek(8,1)
 		vCounts.append(rm.readUShort())
 		rm.seek(8,1)
@@ -1436,15 +2558,16 @@ def LoadModel(data, mdlList):
 		boneLoadLoop = True
 		boneNameFlags = buildFlagFromNames(["boneNames","array:CName"],nameToIndex,0)
 		boneFlags = buildFlagFromNames(["boneRigMatrices","array:Matrix"],nameToIndex,0)
+		cmIndex = CR2WPropertyIndex(cm, indexToName)
 		
-		if (findFlag(cm, boneNameFlags, cMesh.dataSize, 0) if bIsMorphtarget else findFlag(cm, boneNameFlags, cMesh.dataSize, skipFlag)):
+		if cmIndex.find(cm, boneNameFlags):
 			cm.seek(8,1)
 			boneCount = cm.readUInt()
 			for i in range(boneCount):
 				boneNames.append(indexToName[cm.readUShort()])
 				
 				
-		if (findFlag(cm, boneFlags, cMesh.dataSize, 0) if bIsMorphtarget else findFlag(cm, boneFlags, cMesh.dataSize, skipFlag)):
+		if cmIndex.find(cm, boneFlags):
 			cm.seek(4,1)
 			sectionSize = cm.readUInt()				
 			
@@ -1475,7 +2598,7 @@ def LoadModel(data, mdlList):
 			if bAutoDetectRig:
 				gameFolders = []
 				doBodyRig = False; bLoadedHead = False
-				rootFolder = os.path.dirname(rapi.getInputName())
+				rootFolder = os.path.dirname(meshRapi.getInputName())
 				if os.path.isdir(extractedDir):
 					for item in os.listdir(os.path.dirname(extractedDir)):
 						if os.path.isdir(os.path.join(os.path.dirname(extractedDir), item)):
@@ -1486,28 +2609,28 @@ def LoadModel(data, mdlList):
 						if lower.find("hips") != -1 or lower.find("hand")  != -1 or lower.find("leg") != -1  or lower.find("spine") != -1:
 							doBodyRig = True; break
 					
-					fName = rapi.getLocalFileName(rapi.getInputName())
+					fName = meshRapi.getLocalFileName(meshRapi.getInputName())
 					if (len(fName.split("_")) > 2):
 						bodyType = fName.split("_")[2].replace("p","")
 						for folder in gameFolders:
 							if doBodyRig:
-								rigFile = getBaseRig(bodyType, folder)
-								if rapi.checkFileExists(rigFile):
+								rigFile = getBaseRig(bodyType, folder, recorder=recorder)
+								if meshRapi.checkFileExists(rigFile):
 									autoRigs.append(rigFile)
-								rigFile = getBaseRig(bodyType, folder, True)
-								if rapi.checkFileExists(rigFile):
+								rigFile = getBaseRig(bodyType, folder, True, recorder)
+								if meshRapi.checkFileExists(rigFile):
 									autoRigs.append(rigFile)
 							if not bLoadedHead and "Head" in boneNames:
-								if fName.find("wa_") != -1 and rapi.checkFileExists(extractedDir + folder + "\\base\\characters\\head\pwa\\h0_000_pwa_c__basehead\\h0_000_pwa_c__basehead_skeleton.rig"):
+								if fName.find("wa_") != -1 and meshRapi.checkFileExists(extractedDir + folder + "\\base\\characters\\head\pwa\\h0_000_pwa_c__basehead\\h0_000_pwa_c__basehead_skeleton.rig"):
 									autoRigs.append(extractedDir + folder + "\\base\\characters\\head\pwa\\h0_000_pwa_c__basehead\\h0_000_pwa_c__basehead_skeleton.rig")
 									bLoadedHead = True
-								elif rapi.checkFileExists(extractedDir + folder + "\\base\\characters\\head\\player_base_heads\\player_man_average\\h0_000_pma_c__basehead\\h0_000_pma_c__basehead_skeleton.rig"):
+								elif meshRapi.checkFileExists(extractedDir + folder + "\\base\\characters\\head\\player_base_heads\\player_man_average\\h0_000_pma_c__basehead\\h0_000_pma_c__basehead_skeleton.rig"):
 									autoRigs.append(extractedDir + folder + "\\base\\characters\\head\\player_base_heads\\player_man_average\\h0_000_pma_c__basehead\\h0_000_pma_c__basehead_skeleton.rig")
 									bLoadedHead = True
 						
-				inputSplitted = os.path.splitext(rapi.getLocalFileName(rapi.getInputName().lower()))[0].split("_")
-				for fileName in os.listdir(os.path.dirname(rapi.getInputName())):
-					if os.path.isfile(os.path.join(os.path.dirname(rapi.getInputName()), fileName)):
+				inputSplitted = os.path.splitext(meshRapi.getLocalFileName(meshRapi.getInputName().lower()))[0].split("_")
+				for fileName in os.listdir(os.path.dirname(meshRapi.getInputName())):
+					if os.path.isfile(os.path.join(os.path.dirname(meshRapi.getInputName()), fileName)):
 						lowerName = fileName.lower()
 						if fileName.endswith(".rig") and not fileName.endswith("out.rig"):
 							autoRigs.append(os.path.join(rootFolder, fileName))
@@ -1516,64 +2639,33 @@ def LoadModel(data, mdlList):
 			if bLoadRigFile or len(autoRigs) > 0:
 				rigBones = []
 				rigsLoaded = 0
+				rigSummary = []
+				ogIndex = BoneIndex(ogBoneNames, ogBones)
 				while boneLoadLoop:
-					rigData = None
+					rig = None
+					start = time.perf_counter()
 					if bAutoDetectRig and rigsLoaded < len(autoRigs):
-						if rapi.checkFileExists(autoRigs[rigsLoaded]):
-							print ("Auto-detected rig file:", rapi.getLocalFileName(autoRigs[rigsLoaded]))
-							rigData = rapi.loadIntoByteArray(autoRigs[rigsLoaded])
+						if meshRapi.checkFileExists(autoRigs[rigsLoaded]):
+							rigName = meshRapi.getLocalFileName(autoRigs[rigsLoaded])
+							print ("Auto-detected rig file:", rigName)
+							rig = loadParsedRig(autoRigs[rigsLoaded])
 					elif bLoadRigFile:
-						rigData = rapi.loadPairedFileOptional("rig file", ".rig")
+						rigData = meshRapi.loadPairedFileOptional("rig file", ".rig")
 						if rigData is not None:
+							rigName = "Selected rig file " + str(rigsLoaded + 1)
 							print ("Loading selected rig file...")
+							start = time.perf_counter()
+							rig = parseRig(NoeBitStream(rigData))
 							
 					#merge rig skeleton with skeleton:
-					if rigData is not None:
-						br = NoeBitStream(rigData)
-						rigBones, glBoneNames = LoadRig(br, ogBoneNames, list)
+					if rig is not None:
+						rigBones, glBoneNames = LoadRig(rig, ogBoneNames, list)
+						loaded = time.perf_counter()
 						
 						if rigBones:
-							newBones = []
-							newBoneNames = []; uniqueCopyBoneNames = []
-							copyBoneNames = copy.copy(boneNames)
-							copyBoneNames.extend(copy.copy(glBoneNames))
-							#if not bParentToRootIfNoParent and glBoneNames[0] not in boneNames:
-							#	copyBoneNames.insert(0, glBoneNames[0])
-							
-							for boneName in copyBoneNames:
-								if boneName not in uniqueCopyBoneNames: 
-									uniqueCopyBoneNames.append(boneName)
-									
-							for b, bName in enumerate(uniqueCopyBoneNames):
-								newBone = None
-								if bName in ogBoneNames and bName in glBoneNames:
-									newBone = ogBones[ogBoneNames.index(bName)]
-									if newBone.parentName == None:
-										newBone.parentName = rigBones[glBoneNames.index(bName)].parentName
-								elif bName in boneNames:
-									newBone = bones[boneNames.index(bName)]
-								#elif not bParentToRootIfNoParent and bName == glBoneNames[0] and glBoneNames[0] not in boneNames: #add rig root
-								#	newBone = rigBones[0]
-								
-								if newBone is not None:
-									if newBone.parentName in glBoneNames and newBone.parentName not in newBoneNames and newBone.parentName not in boneNames: #add only the rigbones bones needed to link meshbones together
-										boneChain = []
-										parentBone = rigBones[glBoneNames.index(newBone.parentName)]
-										while parentBone.name in uniqueCopyBoneNames and parentBone.name not in boneNames and parentBone.name not in newBoneNames:
-											boneChain.append(parentBone)
-											if parentBone.parentName is not None and parentBone.parentName is not "":
-												parentBone = rigBones[glBoneNames.index(parentBone.parentName)]
-											else: break
-										if boneChain is not None and (bConnectRigToRoot == True or boneChain[len(boneChain)-1].parentName in ogBoneNames):
-											for bn in boneChain:
-												newBones.append(bn)
-												newBones[newBones.index(bn)].index = newBones.index(bn)
-												newBoneNames.append(bn.name)
-									newBones.append(newBone)
-									newBones[newBones.index(newBone)].index = newBones.index(newBone)
-									newBoneNames.append(newBone.name)
-							bones = newBones
-							boneNames = newBoneNames
+							lastBoneCount = len(bones)
+							bones, boneNames = mergeRigBones(bones, boneNames, ogIndex, BoneIndex(glBoneNames, rigBones))
+							rigSummary.append((rigName, len(rigBones), len(bones) - lastBoneCount, loaded - start, time.perf_counter() - loaded))
 							rigsLoaded += 1
 						else:
 							if bLoadRigFile:
@@ -1581,19 +2673,25 @@ def LoadModel(data, mdlList):
 							else: break
 					else:
 						boneLoadLoop = False
+						
+				if rigSummary:
+					print ("Rig merge summary:")
+					for rigName, rigBoneCount, addedCount, loadTime, mergeTime in rigSummary:
+						print ("    " + rigName + ":", rigBoneCount, "rig bones,", addedCount, "bones added, loaded in", "%.3f" % loadTime, "seconds, merged in", "%.3f" % mergeTime, "seconds")
+					print ("    Final skeleton:", len(bones), "bones (" + str(len(ogBones)), "from mesh)")
 			
 			#fix bone map
 			bMap = []
+			boneIndex = BoneIndex.fromBones(bones)
 			for ogBoneName in ogBoneNames:
-				for b, bone in enumerate(bones):
-					if bone.name == ogBoneName and bone.name != "Noesis_Root":
-						bMap.append(bone.index)
-						break
-			rapi.rpgSetBoneMap(bMap)
+				if ogBoneName in boneIndex and ogBoneName != "Noesis_Root":
+					bMap.append(boneIndex.bone(ogBoneName).index)
+			meshRapi.rpgSetBoneMap(bMap)
 			
 			if bParentToRootIfNoParent:
+				boneIndex = BoneIndex(boneNames, bones)
 				for b, bone in enumerate(bones):
-					if bone.parentName not in boneNames:
+					if boneIndex.parents[b] == -1:
 						bone.parentName = "Noesis_Root"
 		cm.seek(0)
 	
@@ -1603,7 +2701,7 @@ def LoadModel(data, mdlList):
 	if "teOffset" in nameToIndex:
 		indOffFlag = buildFlagFromNames(["pe","GpuWrapApieIndexBufferChunkType"],nameToIndex,0)
 		for i in range(submeshCount):
-			if findFlag(rm, indOffFlag, rMesh.dataSize, skipFlag):
+			if rmIndex.find(rm, indOffFlag):
 				if readUShortAt(rm, rm.tell() + 10) < len(indexToName) and indexToName[readUShortAt(rm, rm.tell()+10)] == "teOffset":
 					indOffs.append(readUIntAt(rm, rm.tell()+18))
 				elif i > 0:
@@ -1627,14 +2725,18 @@ def LoadModel(data, mdlList):
 			gMesh = EXPORTS[exportNames.index("meshMeshParamCloth_Graphical")]
 		
 		bs.seek(gMesh.offset)
-		GMESHES = parseGarmentMesh(bs, indexToName, nameToIndex, gMesh, doGarmentMesh, doGarmentMesh2, skipFlag)
+		GMESHES = parseGarmentMesh(bs, indexToName, nameToIndex, gMesh, doGarmentMesh, doGarmentMesh2, source)
 	
 	#collect morphtarget info:
 	if bIsMorphtarget and bImportMorphtargets:
-		allDiffsList = parseMorphs(mm, mMesh, nameToIndex, submeshCount, vCounts)
+		morphDiffs = parseMorphs(mm, mMesh, indexToName, nameToIndex, submeshCount, vCounts, recorder)
+		morphTargets = []
+		if morphDiffs is not None:
+			morphTargets = selectMorphTargets(getMorphTargetFilter(), len(morphDiffs), lambda: getMorphTargetNames(source.view, cMesh, indexToName))
+			print ("Importing", len(morphTargets), "of", len(morphDiffs) - 1, "morph targets")
 		
 	bExtraDataTypeTwo = -1
-	while findFlag(rm, vDefFlag, rMesh.dataSize, skipFlag):
+	while rmIndex.find(rm, vDefFlag):
 		rm.seek(17, 1)
 		compC = rm.readInt()
 		rm.seek(1, 1)
@@ -1690,7 +2792,7 @@ def LoadModel(data, mdlList):
 	
 	# Vertex component offsets
 	vCompOffs = []
-	while findFlag(rm, cmpOffFlag, rMesh.dataSize, skipFlag):
+	while rmIndex.find(rm, cmpOffFlag):
 		rm.seek(8, 1)
 		offC = rm.readInt()
 		offs = []
@@ -1701,7 +2803,7 @@ def LoadModel(data, mdlList):
 	
 	#Get index section offset
 	indexOfsFlag = buildFlagFromNames(["indexBufferOffset","Uint32"],nameToIndex,0)
-	if not findFlag(rm, indexOfsFlag, rMesh.dataSize, skipFlag):
+	if not rmIndex.find(rm, indexOfsFlag):
 		print("Couldn't find index offset")
 		return 0
 	else:
@@ -1712,25 +2814,32 @@ def LoadModel(data, mdlList):
 	#Grab LOD info
 	lodInfo = []
 	LODInfoFlag = buildFlagFromNames(["lodMask","Uint8"],nameToIndex,0)
-	while findFlag(rm, LODInfoFlag, rMesh.dataSize, skipFlag):
+	while rmIndex.find(rm, LODInfoFlag):
 		rm.seek(8, 1)
 		lodInfo.append(rm.readUByte())
 	rm.seek(0)
 	 
 	
+	if bCompress and bParallelDecompress:
+		usedBuffers = {bufferNo}
+		if doGarmentMesh or doGarmentMesh2:
+			for gmesh in GMESHES:
+				usedBuffers.update((gmesh.vertices, gmesh.indices) if doGarmentMesh else (gmesh.vertices, gmesh.indices, gmesh.skinIndices, gmesh.skinIndicesExt, gmesh.skinWeights, gmesh.skinWeightsExt))
+		prefetchCR2WBuffers(bs, buffers, usedBuffers)
+		
 	if bufferNo > -1:
-		bfs = GetCR2WBuffer(bs, buffers, ext, bufferNo)
+		bfs = GetCR2WBuffer(bs, buffers, ext, bufferNo, recorder)
 		
 	if not bfs or bfs.getSize() == 0:
 		print ("Failed to acquire Vertex Buffer")
 		return 0
 	
 	#rapi context settings
-	rapi.rpgSetTransform((NoeVec3((-1,0,0)), NoeVec3((0,0,1)), NoeVec3((0,1,0)), NoeVec3((0,0,0)))) 
-	rapi.rpgSetOption(noesis.RPGOPT_TRIWINDBACKWARD, 1)
+	meshRapi.rpgSetTransform((NoeVec3((-1,0,0)), NoeVec3((0,0,1)), NoeVec3((0,1,0)), NoeVec3((0,0,0)))) 
+	meshRapi.rpgSetOption(noesis.RPGOPT_TRIWINDBACKWARD, 1)
 	if bFlipImage:
-		rapi.rpgSetUVScaleBias(NoeVec3 ((1.0, -1.0, 1.0)), NoeVec3 ((-1.0, 1.0, 1.0)), 0)
-		rapi.rpgSetUVScaleBias(NoeVec3 ((1.0, -1.0, 1.0)), NoeVec3 ((-1.0, 1.0, 1.0)), 1)
+		meshRapi.rpgSetUVScaleBias(NoeVec3 ((1.0, -1.0, 1.0)), NoeVec3 ((-1.0, 1.0, 1.0)), 0)
+		meshRapi.rpgSetUVScaleBias(NoeVec3 ((1.0, -1.0, 1.0)), NoeVec3 ((-1.0, 1.0, 1.0)), 1)
 	
 	#Parsing semantics
 	posBuffers = []
@@ -1748,34 +2857,34 @@ def LoadModel(data, mdlList):
 			break
 		if bHighestLODOnly and i < len(lodInfo) and lodInfo[i] != currentLOD:  #build previous LOD as new NoeModel
 			try:
-				mdl = rapi.rpgConstructModelAndSort()
+				mdl = meshRapi.rpgConstructModelAndSort()
 			except:
 				mdl = NoeModel()
 			if bRiggedModel and bones: 
 				mdl.setBones(bones)
 			mdlList.append(mdl)
 			currentLOD = lodInfo[i]
-			ctx = rapi.rpgCreateContext()	
+			ctx = meshRapi.rpgCreateContext()	
 			
 			#reset rapi context settings
-			rapi.rpgSetTransform((NoeVec3((-1,0,0)), NoeVec3((0,0,1)), NoeVec3((0,1,0)), NoeVec3((0,0,0)))) 
+			meshRapi.rpgSetTransform((NoeVec3((-1,0,0)), NoeVec3((0,0,1)), NoeVec3((0,1,0)), NoeVec3((0,0,0)))) 
 			if bFlipImage:
-				rapi.rpgSetUVScaleBias(NoeVec3 ((1.0, -1.0, 1.0)), NoeVec3 ((-1.0, 1.0, 1.0)), 0)
-				rapi.rpgSetUVScaleBias(NoeVec3 ((1.0, -1.0, 1.0)), NoeVec3 ((-1.0, 1.0, 1.0)), 1)
+				meshRapi.rpgSetUVScaleBias(NoeVec3 ((1.0, -1.0, 1.0)), NoeVec3 ((-1.0, 1.0, 1.0)), 0)
+				meshRapi.rpgSetUVScaleBias(NoeVec3 ((1.0, -1.0, 1.0)), NoeVec3 ((-1.0, 1.0, 1.0)), 1)
 			if isHairMesh:
-				rapi.rpgSetOption(noesis.RPGOPT_FIXTRIWINDINGS, 1)
+				meshRapi.rpgSetOption(noesis.RPGOPT_FIXTRIWINDINGS, 1)
 			else:
-				rapi.rpgSetOption(noesis.RPGOPT_TRIWINDBACKWARD, 1)	
+				meshRapi.rpgSetOption(noesis.RPGOPT_TRIWINDBACKWARD, 1)	
 		
 		if isHairMesh == False:
 			bfs.seek(idxOffset + indOffs[i])
 			testFcOne  = [bfs.readUShort(), bfs.readUShort(), bfs.readUShort()]; testFcTwo  = [bfs.readUShort(), bfs.readUShort(), bfs.readUShort()]
 			if testFcOne == [testFcTwo[0], testFcTwo[2], testFcTwo[1]]:
 				isHairMesh = True 
-				rapi.rpgSetOption(noesis.RPGOPT_TRIWINDBACKWARD, 0)	
-				rapi.rpgSetOption(noesis.RPGOPT_FIXTRIWINDINGS, 1)
+				meshRapi.rpgSetOption(noesis.RPGOPT_TRIWINDBACKWARD, 0)	
+				meshRapi.rpgSetOption(noesis.RPGOPT_FIXTRIWINDINGS, 1)
 			else:
-				rapi.rpgSetOption(noesis.RPGOPT_TRIWINDBACKWARD, 1)
+				meshRapi.rpgSetOption(noesis.RPGOPT_TRIWINDBACKWARD, 1)
 		
 		vertDef = vertDefs[vDefInd]
 		vCompOff = vCompOffs[vDefInd]
@@ -1807,39 +2916,17 @@ def LoadModel(data, mdlList):
 			start = bfs.tell()
 			if comp[0] == "PS_Position":
 				buffer = bfs.readBytes(vc*(posBStride))
-				posList = []
-				for v in range(vc):
-					idx = posBStride * v
-					vx  = (float((struct.unpack_from('h', buffer, idx))[0]) / 32767.0)
-					vy  = (float((struct.unpack_from('h', buffer, idx + 2))[0]) / 32767.0)
-					vz  = (float((struct.unpack_from('h', buffer, idx + 4))[0]) / 32767.0)
-					posList.append((vx * qScale[0] + qOff[0]) * meshScale) 
-					posList.append((vy * qScale[1] + qOff[1]) * meshScale)
-					posList.append((vz * qScale[2] + qOff[2]) * meshScale)
-				
-				posBuff = struct.pack("<" + 'f'*len(posList), *posList)
-				rapi.rpgBindPositionBufferOfs(posBuff, noesis.RPGEODATA_FLOAT, 12, 0)
+				posBuff = dequantizePositions(buffer, vc, posBStride, qScale, qOff)
+				meshRapi.rpgBindPositionBufferOfs(posBuff, noesis.RPGEODATA_FLOAT, 12, 0)
 					
 				if doGarmentMesh or doGarmentMesh2:
 				
-					vtxStream = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].vertices)
+					vtxStream = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].vertices, recorder)
 					
 					if vtxStream:
-						GposList = []
-						for v in range(vc):
-							GposList.append(vtxStream.readFloat() * meshScale) 
-							GposList.append(vtxStream.readFloat() * meshScale)
-							GposList.append(vtxStream.readFloat() * meshScale)
-						gPosBuff = struct.pack("<" + 'f'*len(GposList), *GposList)
+						gPosBuff = scaleFloats(vtxStream.getBuffer(), vc * 3, meshScale)
 						
-					mphStream = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].morphOffsets)
-					if mphStream:
-						morphList = []
-						for v in range(vc):
-							morphList.append(mphStream.readFloat() * meshScale) 
-							morphList.append(mphStream.readFloat() * meshScale)
-							morphList.append(mphStream.readFloat() * meshScale)
-						#posBuff = struct.pack("<" + 'f'*len(morphList), *morphList)
+					#the garment morphOffsets buffer is not used by the import, so it is not read
 					
 					#force reverse GarmentMesh winding order:
 					#gmFacesList = []
@@ -1847,36 +2934,32 @@ def LoadModel(data, mdlList):
 					#for idx in range(0, int(len(facesBuff)/2), 3):
 					#	gmFacesList.extend([struct.unpack_from('h', facesBuff, idx*2)[0], struct.unpack_from('h', facesBuff, idx*2 + 4)[0], struct.unpack_from('h', facesBuff, idx*2 + 2)[0]])
 					#facesStream = NoeBitStream(struct.pack("<" + 'h'*len(gmFacesList), *gmFacesList))
-					facesStream = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].indices)
+					facesStream = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].indices, recorder)
 					
 					if doGarmentMesh2:
-						gs = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].skinIndices)
+						gs = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].skinIndices, recorder)
 						if gs: 
-							idxStream = NoeBitStream()
+							idxBuff = b''
 							if GMESHES[i].skinIndicesExt != -1:
-								gs2 = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].skinIndicesExt)
+								gs2 = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].skinIndicesExt, recorder)
 								if gs2: 
-									for j in range(gs2.getSize()):
-										idxStream.writeBytes(gs.readBytes(4))
-										idxStream.writeBytes(gs2.readBytes(4))
-							if idxStream.getSize(): rapi.rpgBindBoneIndexBuffer(idxStream.getBuffer(), noesis.RPGEODATA_UBYTE, 8, 8)
-							else: rapi.rpgBindBoneIndexBuffer(gs.getBuffer(), noesis.RPGEODATA_UBYTE, 4, 4)
+									idxBuff = interleaveRecords(gs.getBuffer(), gs2.getBuffer(), 4) #4 + 4 extended bone indices per vertex
+							if idxBuff: meshRapi.rpgBindBoneIndexBuffer(idxBuff, noesis.RPGEODATA_UBYTE, 8, 8)
+							else: meshRapi.rpgBindBoneIndexBuffer(gs.getBuffer(), noesis.RPGEODATA_UBYTE, 4, 4)
 								
-						gsW = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].skinWeights)
+						gsW = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].skinWeights, recorder)
 						if gsW:
+							weightBuff = b''
 							if GMESHES[i].skinWeightsExt != -1:
-								weightStream = NoeBitStream()
-								gs2 = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].skinWeightsExt)
+								gs2 = GetCR2WBuffer(bs, buffers, ext, GMESHES[i].skinWeightsExt, recorder)
 								if gs2:
-									for j in range(int(gs2.getSize() / 8)):
-										weightStream.writeBytes(gsW.readBytes(16))
-										weightStream.writeBytes(gs2.readBytes(16))
-								if weightStream.getSize(): rapi.rpgBindBoneWeightBuffer(weightStream.getBuffer(), noesis.RPGEODATA_FLOAT, 32, 8)
-								else: rapi.rpgBindBoneWeightBuffer(gs2.getBuffer(), noesis.RPGEODATA_FLOAT, 16, 4)
+									weightBuff = interleaveRecords(gsW.getBuffer(), gs2.getBuffer(), 16) #4 + 4 extended float weights per vertex
+							if weightBuff: meshRapi.rpgBindBoneWeightBuffer(weightBuff, noesis.RPGEODATA_FLOAT, 32, 8)
+							else: meshRapi.rpgBindBoneWeightBuffer(gsW.getBuffer(), noesis.RPGEODATA_FLOAT, 16, 4)
 				
 				if skinBICount > 0:
-					rapi.rpgBindBoneIndexBufferOfs(buffer, noesis.RPGEODATA_UBYTE, posBStride, 8, 4 * skinBICount)
-					rapi.rpgBindBoneWeightBufferOfs(buffer, noesis.RPGEODATA_UBYTE, posBStride, 8 + 4 * skinBICount, 4 * skinBWCount)
+					meshRapi.rpgBindBoneIndexBufferOfs(buffer, noesis.RPGEODATA_UBYTE, posBStride, 8, 4 * skinBICount)
+					meshRapi.rpgBindBoneWeightBufferOfs(buffer, noesis.RPGEODATA_UBYTE, posBStride, 8 + 4 * skinBICount, 4 * skinBWCount)
 				
 			elif comp[0] == "PS_TexCoord": 
 				if uvAdded == 0:
@@ -1886,7 +2969,7 @@ def LoadModel(data, mdlList):
 						print("UV1: Error, wrong buffer file used, try to rename the mesh and the .buffer")
 						return 0
 					uv1buff = bfs.readBytes(vc*4)
-					rapi.rpgBindUV1Buffer(uv1buff, noesis.RPGEODATA_HALFFLOAT, 4)
+					meshRapi.rpgBindUV1Buffer(uv1buff, noesis.RPGEODATA_HALFFLOAT, 4)
 				elif uvAdded == 1: 
 					if(vCompOff[3] < bfs.getSize()):		
 						bfs.seek(vCompOff[3])
@@ -1895,9 +2978,9 @@ def LoadModel(data, mdlList):
 						return 0
 						
 					uv2buff = bfs.readBytes(vc*8)
-					rapi.rpgBindUV2BufferOfs(uv2buff, noesis.RPGEODATA_HALFFLOAT, 8, 4)
+					meshRapi.rpgBindUV2BufferOfs(uv2buff, noesis.RPGEODATA_HALFFLOAT, 8, 4)
 					if bVertexColors:
-						rapi.rpgBindColorBufferOfs(uv2buff, noesis.RPGEODATA_UBYTE, 8, 0, 4)
+						meshRapi.rpgBindColorBufferOfs(uv2buff, noesis.RPGEODATA_UBYTE, 8, 0, 4)
 				uvAdded = uvAdded + 1
 				
 			elif comp[0] == "PS_Normal":
@@ -1906,51 +2989,24 @@ def LoadModel(data, mdlList):
 				else:
 					print("Normals: Error, wrong buffer file used, try to rename the mesh and the .buffer")
 					return 0
-				nrmList = []
-				tanList = []
-				for v in range(vc):
-					norm = bfs.readInt()
-					tan = bfs.readInt()
-					nX = ((((norm & 1023)) ) - 511) / 512.0
-					nY = ((((norm >> 10) & 1023) ) - 511) / 512.0
-					nZ = ((((norm >> 20) & 1023) ) - 511) / 512.0
-					nW = (int(((norm >> 30)) / 127.0)) / 3.0
-					nrmList.append(nX)
-					nrmList.append(nY)
-					nrmList.append(nZ)
-					if bReadTangents:
-						tX = ((((tan & 1023)) ) - 511) / 512.0
-						tY = ((((tan >> 10) & 1023) ) - 511) / 512.0
-						tZ = ((((tan >> 20) & 1023) ) - 511) / 512.0
-						tW = (int(((tan >> 30)) / 127.0)) / 3.0
-						tanList.append(tX)
-						tanList.append(tY)
-						tanList.append(tZ)
-						tanList.append(tW)
-					
-				#print ("Normals end:", bfs.tell())
-				nrmBuff = struct.pack("<" + 'f'*len(nrmList), *nrmList)
+				nrmTanBuff = bfs.readBytes(vc*8)
+				nrmBuff = unpack101010(nrmTanBuff, vc, 8, 0)
 				
 				#rapi.rpgBindNormalBuffer(nrmBuff, noesis.RPGEODATA_FLOAT, 12)
 				if bReadTangents:
-					tanBuff = struct.pack("<" + 'f'*len(tanList), *tanList)
-					rapi.rpgBindTangentBuffer(tanBuff, noesis.RPGEODATA_FLOAT, 16)
+					tanBuff = unpack101010(nrmTanBuff, vc, 8, 4, bWriteW=True)
+					meshRapi.rpgBindTangentBuffer(tanBuff, noesis.RPGEODATA_FLOAT, 16)
 					
 				if bIsMorphtarget and bImportMorphtargets:
 					
-					for t in range(1, len(allDiffsList)):
-						#for j in range(len(allDiffsList[t])):
+					for t in morphTargets:
 						j = i
-						morphBStream = NoeBitStream()
-						for k in range(0, len(allDiffsList[t][j][0])):
-							morphBStream.writeBytes((allDiffsList[t][j][0][k] * (meshScale/2)).toBytes())
-								
-						#morphBuff = struct.pack("<" + 'f'*len(morphList), *morphList)
+						morphBuff = morphDiffs.positions(t, j)
 						#morphNormsBuff = struct.pack("<" + 'f'*len(morphNormsList), *morphNormsList)
-						rapi.rpgFeedMorphTargetPositions(morphBStream.getBuffer(), noesis.RPGEODATA_FLOAT, 12)
+						meshRapi.rpgFeedMorphTargetPositions(morphBuff, noesis.RPGEODATA_FLOAT, 12)
 						#rapi.rpgFeedMorphTargetNormals(morphNormsBuff, noesis.RPGEODATA_FLOAT, 12)
-						rapi.rpgCommitMorphFrame(len(allDiffsList[t][j][0]))
-					rapi.rpgCommitMorphFrameSet()
+						meshRapi.rpgCommitMorphFrame(len(morphBuff) // 12)
+					meshRapi.rpgCommitMorphFrameSet()
 						
 			elif comp[0] == "PS_VehicleDmgPosition":
 				if(vCompOff[4] < bfs.getSize()):		
@@ -1958,33 +3014,24 @@ def LoadModel(data, mdlList):
 				else:
 					print("Normals: Error, wrong buffer file used, try to rename the mesh and the .buffer")
 					return 0
-				db = NoeBitStream()
-				dn = NoeBitStream()
-				for v in range(vc):
-					dNorm = bfs.readInt()
-					nX = ((((dNorm & 1023)) ) - 511) / 512.0
-					nY = ((((dNorm >> 10) & 1023) ) - 511) / 512.0
-					nZ = ((((dNorm >> 20) & 1023) ) - 511) / 512.0
-					dn.writeFloat(nX)
-					dn.writeFloat(nY)
-					dn.writeFloat(nZ)
-					dx = bfs.readFloat() * meshScale
-					dy = bfs.readFloat() * meshScale
-					dz = bfs.readFloat() * meshScale
-					dw = bfs.readFloat()
-					db.writeFloat(dx * 100)
-					db.writeFloat(dy * 100)
-					db.writeFloat(dz * 100)
-				
-				damageBuffer = db.getBuffer()
-				damageNormals = dn.getBuffer()
+				dmgBuff = bfs.readBytes(vc*20)
+				damageNormals = unpack101010(dmgBuff, vc, 20, 0)
+				if np is not None:
+					dmgPositions = np.ndarray((vc, 3), dtype='<f4', buffer=dmgBuff, offset=4, strides=(20, 4))
+					damageBuffer = (dmgPositions.astype(np.float64) * meshScale * 100).astype('<f4').tobytes()
+				else:
+					dmgList = []
+					for v in range(vc):
+						dx, dy, dz = struct.unpack_from('<fff', dmgBuff, v * 20 + 4)
+						dmgList.extend(((dx * meshScale) * 100, (dy * meshScale) * 100, (dz * meshScale) * 100))
+					damageBuffer = struct.pack("<" + 'f'*len(dmgList), *dmgList)
 				
 			else:
 				continue
 				
 		#grab indices, commit, clear buffers
-		rapi.rpgSetName("submesh"+str(i))
-		rapi.rpgSetMaterial("")
+		meshRapi.rpgSetName("submesh"+str(i))
+		meshRapi.rpgSetMaterial("")
 		
 		bfs.seek(idxOffset + indOffs[i])
 		idxBuff = bfs.readBytes(idxCounts[i]*2)
@@ -1993,33 +3040,36 @@ def LoadModel(data, mdlList):
 		#	facesList.extend([struct.unpack_from('h', idxBuff, idx*2)[0], struct.unpack_from('h', idxBuff, idx*2 + 4)[0], struct.unpack_from('h', idxBuff, idx*2 + 2)[0]])
 		#idxBuff = struct.pack("<" + 'h'*len(facesList), *facesList)
 		
-		rapi.rpgBindNormalBuffer(nrmBuff, noesis.RPGEODATA_FLOAT, 12)
+		meshRapi.rpgBindNormalBuffer(nrmBuff, noesis.RPGEODATA_FLOAT, 12)
 		
 		try:
-			rapi.rpgCommitTriangles(idxBuff, noesis.RPGEODATA_USHORT, idxCounts[i], noesis.RPGEO_TRIANGLE, 1)
+			meshRapi.rpgCommitTriangles(idxBuff, noesis.RPGEODATA_USHORT, idxCounts[i], noesis.RPGEO_TRIANGLE, 1)
 		except:
 			print ("Failed to construct mesh \"submesh" + str(i) + "\"")
 		
 		if damageBuffer != 0 and bImportExportDamageMeshes:
-			rapi.rpgSetName("submesh"+str(i)+"_damageMesh")
-			rapi.rpgSetMaterial("")
-			rapi.rpgSetTransform((NoeVec3((-1,0,0)), NoeVec3((0,0,1)), NoeVec3((0,1,0)), NoeVec3((0,0,0)))) 
-			rapi.rpgBindPositionBufferOfs(damageBuffer, noesis.RPGEODATA_FLOAT, 12, 0)
-			rapi.rpgBindNormalBuffer(damageNormals, noesis.RPGEODATA_FLOAT, 12) 
-			rapi.rpgCommitTriangles(idxBuff, noesis.RPGEODATA_USHORT, idxCounts[i], noesis.RPGEO_TRIANGLE, 1)
+			meshRapi.rpgSetName("submesh"+str(i)+"_damageMesh")
+			meshRapi.rpgSetMaterial("")
+			meshRapi.rpgSetTransform((NoeVec3((-1,0,0)), NoeVec3((0,0,1)), NoeVec3((0,1,0)), NoeVec3((0,0,0)))) 
+			meshRapi.rpgBindPositionBufferOfs(damageBuffer, noesis.RPGEODATA_FLOAT, 12, 0)
+			meshRapi.rpgBindNormalBuffer(damageNormals, noesis.RPGEODATA_FLOAT, 12) 
+			meshRapi.rpgCommitTriangles(idxBuff, noesis.RPGEODATA_USHORT, idxCounts[i], noesis.RPGEO_TRIANGLE, 1)
 			
-		rapi.rpgClearBufferBinds()
+		meshRapi.rpgClearBufferBinds()
 		if bImportGarmentMesh and (doGarmentMesh or doGarmentMesh2):
 			try:
-				rapi.rpgSetPosScaleBias(NoeVec3((100,100,100)), None)
-				rapi.rpgBindPositionBufferOfs(vtxStream.getBuffer(), noesis.RPGEODATA_FLOAT, 12, 0)
-				rapi.rpgSetName("submesh"+str(i)+"_garmentMesh")
-				rapi.rpgCommitTriangles(facesStream.getBuffer(), noesis.RPGEODATA_USHORT, int(facesStream.getSize()/2), noesis.RPGEO_TRIANGLE, 1)
+				meshRapi.rpgSetPosScaleBias(NoeVec3((100,100,100)), None)
+				meshRapi.rpgBindPositionBufferOfs(vtxStream.getBuffer(), noesis.RPGEODATA_FLOAT, 12, 0)
+				meshRapi.rpgSetName("submesh"+str(i)+"_garmentMesh")
+				meshRapi.rpgCommitTriangles(facesStream.getBuffer(), noesis.RPGEODATA_USHORT, int(facesStream.getSize()/2), noesis.RPGEO_TRIANGLE, 1)
 			except:
 				print("Failed to construct Garment Mesh", i) 
-			rapi.rpgSetPosScaleBias(NoeVec3((1,1,1)), None)
-			rapi.rpgClearBufferBinds()
+			meshRapi.rpgSetPosScaleBias(NoeVec3((1,1,1)), None)
+			meshRapi.rpgClearBufferBinds()
 			
+	if bIsMorphtarget and bImportMorphtargets and morphDiffs is not None:
+		morphDiffs.close()
+		
 	#rapi.rpgOptimize()
 	#rapi.rpgUnifyBinormals(0)
 	#rapi.rpgFlatNormals()
@@ -2027,21 +3077,17 @@ def LoadModel(data, mdlList):
 	#rapi.rpgSmoothNormals()
 	
 	try:
-		mdl = rapi.rpgConstructModelAndSort()
+		mdl = meshRapi.rpgConstructModelAndSort()
 	except:
 		mdl = NoeModel()
 		
 	if noesis.optWasInvoked("-cp77optimize"):
-		rapi.rpgOptimize()
+		meshRapi.rpgOptimize()
 		
 	if bRiggedModel and bones: 
 		mdl.setBones(bones)
 	mdlList.append(mdl)
 	
-	
-	if mdlList[0].meshes and not rapi.noesisIsExporting() and mdlList[0].meshes[0].name.find("_") != -1:
-		print ("WARNING: Mesh split detected!\nUse the advanced option '-fbxmeshmerge' when exporting this model to FBX.")
-	
 	'''for mesh in mdl.meshes:
 		for uvs in mesh.uvs: 
 			uvs[0] = uvs[0] % 1.0
@@ -2111,6 +3157,7 @@ def meshWriteModel(mdl, outfile):
 			
 	newMesh = rapi.loadIntoByteArray(expOverMeshName)
 	f = NoeBitStream(newMesh)
+	source = CR2WSource(newMesh)
 	magic = f.readUInt() 
 	if magic != 1462915651:
 		noesis.messagePrompt("Not a .mesh file.\nAborting...")
@@ -2132,16 +3179,14 @@ def meshWriteModel(mdl, outfile):
 		cMesh = EXPORTS[exportNames.index("CMesh")]
 		ext = "mesh"
 		
-	f.seek(cMesh.offset)
-	cm = NoeBitStream(f.readBytes(cMesh.dataSize))
+	cm = source.exportStream(cMesh)
 	rMesh = EXPORTS[exportNames.index("rendRenderMeshBlob")]
-	f.seek(rMesh.offset)
-	rm = NoeBitStream(f.readBytes(rMesh.dataSize))
+	rm = source.exportStream(rMesh)
+	rmIndex = CR2WPropertyIndex(rm, names, data=source.exportSlice(rMesh)) #index the property headers once instead of rescanning the blob for every flag
 	
 	bRiggedModel = True if "boneRigMatrices" in names else False
 	
 	#build flags:
-	skipFlag = buildFlagFromNames(["topology","array:rendTopologyData"],nameToIndex,0) 
 	quantScaleFlag = buildFlagFromNames(["quantizationScale","Vector4"],nameToIndex,0)
 	quantOffFlag = buildFlagFromNames(["quantizationOffset","Vector4"],nameToIndex,0)
 	posFlag = buildFlagFromNames(["numVertices","Uint16"],nameToIndex,0)
@@ -2159,15 +3204,14 @@ def meshWriteModel(mdl, outfile):
 		if EXPORTS[i].name == "CMesh":
 			meshCount += 1
 		if EXPORTS[i].name == "rendRenderMeshBlob" and bufferNo == -1:
-			findFlag(rm, uncompressedDataFlag, rMesh.dataSize, skipFlag) 
+			rmIndex.find(rm, uncompressedDataFlag)
 			rm.seek(4,1)
 			bufferSize = rm.readUInt()
 			rm.seek(4,1)
 			if bufferSize > 8: #uncompressed DataBuffer
 				bufferStart = rm.tell()
-				bfs = NoeBitStream(rm.readBytes(rm.getSize()-rm.tell()))
-				rm.seek(0)
-				rm = NoeBitStream(rm.readBytes(bufferStart))
+				bfs = source.stream(rMesh.offset + bufferStart, rm.getSize() - bufferStart)
+				rm = source.stream(rMesh.offset, bufferStart)
 			else: #regular DataBuffer
 				bufferNo = readUShortAt(f, EXPORTS[i].dataEnd-6) - 1
 			rm.seek(0)
@@ -2191,7 +3235,7 @@ def meshWriteModel(mdl, outfile):
 			doGarmentMesh2 = True
 			gMesh = EXPORTS[exportNames.index("meshMeshParamCloth_Graphical")]
 			
-		GMESHES = parseGarmentMesh(f, names, nameToIndex, gMesh, doGarmentMesh, doGarmentMesh2, skipFlag)
+		GMESHES = parseGarmentMesh(f, names, nameToIndex, gMesh, doGarmentMesh, doGarmentMesh2, source)
 	
 	if not bCompress:
 		#Grab correct paired buffer file (old versions)
@@ -2223,7 +3267,8 @@ def meshWriteModel(mdl, outfile):
 	bs = NoeBitStream()	
 	#find bone names
 	if bRiggedModel:
-		if findFlag(cm, bnNamesFlag, cMesh.dataSize, skipFlag):
+		cmIndex = CR2WPropertyIndex(cm, names)
+		if cmIndex.find(cm, bnNamesFlag):
 			cm.seek(8,1)
 			boneCount = cm.readUInt()
 			boneNames = []
@@ -2233,15 +3278,12 @@ def meshWriteModel(mdl, outfile):
 		#Write new bone positions:
 		if bWriteBones or bWriteRig:
 			if bWriteBones:
-				if findFlag(cm, boneFlags, cMesh.dataSize, skipFlag):
+				if cmIndex.find(cm, boneFlags):
 					cm.seek(8,1)
 					bnRigMatrixCount = cm.readUInt()
+					mdlIndex = BoneIndex.fromBones(mdl.bones)
 					for i in range(boneCount):
-						fbxBoneIdx = -1
-						for b, bone in enumerate(mdl.bones):
-							if boneNames[i] == bone.name:
-								fbxBoneIdx = b
-								break
+						fbxBoneIdx = mdlIndex.find(boneNames[i])
 
 						#print (i, len(boneNames))
 						if fbxBoneIdx != -1:
@@ -2286,11 +3328,12 @@ def meshWriteModel(mdl, outfile):
 					nuRig.writeBytes(ogRig.readBytes(ogRig.getSize()))
 					rigIdxToName, rigNameToIdx, rigMaxOffset, rigEXPORTS, rigExportNames, rigBuffers = ParseHeader(nuRig)
 					checkPoint = nuRig.tell()
+					rigIndex = CR2WPropertyIndex(nuRig, rigIdxToName, rigEXPORTS)
 					
 					# Read bone names
 					glBoneNames = []
 					rigBnNamesFlag = buildFlagFromNames(["boneNames","array:CName"], rigNameToIdx, 0)
-					if findFlag(nuRig, rigBnNamesFlag, rigMaxOffset, 0):
+					if rigIndex.find(nuRig, rigBnNamesFlag):
 						nuRig.seek(0x8,1)
 						boneC = nuRig.readInt()
 						for i in range(boneC):
@@ -2298,9 +3341,10 @@ def meshWriteModel(mdl, outfile):
 						nuRig.seek(checkPoint)
 						
 						#prepare matrices for writing
-						rigTRSes = []; mdlBoneNames = []
+						rigTRSes = []
+						glIndex = BoneIndex(glBoneNames)
+						mdlIndex = BoneIndex.fromBones(mdl.bones)
 						for bone in mdl.bones:
-							mdlBoneNames.append(bone.name)
 							matrix = (bone.getMatrix().inverse() * localMat).inverse() #rotate back in-place
 							if bone.parentIndex > -1:
 								matrix *= (mdl.bones[bone.parentIndex].getMatrix().inverse() * localMat.inverse()) #rotate parent back in-place (meshBones)
@@ -2312,12 +3356,12 @@ def meshWriteModel(mdl, outfile):
 						# Write A-poseLS bones
 						if "aPoseLS" in rigIdxToName:
 							aposeLSFlag = buildFlagFromNames(["aPoseLS","array:QsTransform"],rigNameToIdx,0)
-							if findFlag(nuRig, aposeLSFlag, rigMaxOffset, 0):
+							if rigIndex.find(nuRig, aposeLSFlag):
 								nuRig.seek(8,1)
 								apBoneCLS = nuRig.readInt()
 								for i in range(apBoneCLS):
-									if glBoneNames[i] in mdlBoneNames:
-										matrix = rigTRSes[mdlBoneNames.index(glBoneNames[i])]
+									if glBoneNames[i] in mdlIndex:
+										matrix = rigTRSes[mdlIndex.find(glBoneNames[i])]
 										pos = nuRig.tell()
 										writeFloatAt(nuRig, pos+18, matrix[0][0])
 										writeFloatAt(nuRig, pos+30, matrix[0][1])
@@ -2336,12 +3380,12 @@ def meshWriteModel(mdl, outfile):
 						# Write A-poseMS bones
 						if "aPoseMS" in rigIdxToName:
 							aposeMSFlag = buildFlagFromNames(["aPoseMS","array:QsTransform"],rigNameToIdx,0)
-							if findFlag(nuRig, aposeLSFlag, rigMaxOffset, 0):
+							if rigIndex.find(nuRig, aposeLSFlag):
 								nuRig.seek(8,1)
 								apBoneCMS = nuRig.readInt()
 								for i in range(apBoneCMS):
-									if glBoneNames[i] in mdlBoneNames:
-										matrix = rigTRSes[mdlBoneNames.index(glBoneNames[i])]
+									if glBoneNames[i] in mdlIndex:
+										matrix = rigTRSes[mdlIndex.find(glBoneNames[i])]
 										pos = nuRig.tell()
 										writeFloatAt(nuRig, pos+18, matrix[0][0])
 										writeFloatAt(nuRig, pos+30, matrix[0][1])
@@ -2361,38 +3405,30 @@ def meshWriteModel(mdl, outfile):
 						findFlag(nuRig, b'\xFF\xFF\x00\x00', rigMaxOffset, 0)
 						parIds = []
 						for b in range(boneC):
-							wroteBone = False
-							for bone in mdl.bones:
-								if bone.parentName != "Noesis_Root" and bone.name == glBoneNames[b] and bone.parentName in glBoneNames:
-									nuRig.writeUShort(glBoneNames.index(bone.parentName))
-									wroteBone = True
-									break
-							if not wroteBone:
+							mdlBoneIdx = mdlIndex.find(glBoneNames[b])
+							if mdlBoneIdx != -1 and mdl.bones[mdlBoneIdx].parentName != "Noesis_Root" and mdl.bones[mdlBoneIdx].parentName in glIndex:
+								nuRig.writeUShort(glIndex.find(mdl.bones[mdlBoneIdx].parentName))
+							else:
 								nuRig.seek(2, 1)
 						
 						#T R S
 						for b in range(boneC):
-							wroteBone = False
-							for bone in mdl.bones:
-								#if bone.parentName != "Noesis_Root" and bone.name == glBoneNames[b] and bone.parentName in glBoneNames:
-								if glBoneNames[b] in mdlBoneNames and len(rigTRSes[mdlBoneNames.index(glBoneNames[b])][0]) > 2:
-									matrix = rigTRSes[mdlBoneNames.index(glBoneNames[i])]
-									bNoRot = True if "aPoseLS" in rigIdxToName else False
-									
-									for k in range(3):
-										for j in range(4):
-											if k == 0:
-												nuRig.writeFloat(matrix[0][j])
-											elif k == 1:
-												if bNoRot:
-													nuRig.seek(4,1)
-												else:
-													nuRig.writeFloat(matrix[1][j])
-											elif k == 2:
-												nuRig.writeFloat(matrix[2][j])
-									wroteBone = True
-									break	
-							if not wroteBone:
+							if glBoneNames[b] in mdlIndex and len(rigTRSes[mdlIndex.find(glBoneNames[b])][0]) > 2:
+								matrix = rigTRSes[mdlIndex.find(glBoneNames[b])]
+								bNoRot = True if "aPoseLS" in rigIdxToName else False
+								
+								for k in range(3):
+									for j in range(4):
+										if k == 0:
+											nuRig.writeFloat(matrix[0][j])
+										elif k == 1:
+											if bNoRot:
+												nuRig.seek(4,1)
+											else:
+												nuRig.writeFloat(matrix[1][j])
+										elif k == 2:
+											nuRig.writeFloat(matrix[2][j])
+							else:
 								nuRig.seek(48, 1)
 								
 						outRig = os.path.splitext(rapi.getOutputName())[0] + ".rig"
@@ -2405,7 +3441,7 @@ def meshWriteModel(mdl, outfile):
 	#Grab LOD info
 	lodInfo = []
 	if bHighestLODOnly:
-		if (findFlag(rm, lodFlag, rMesh.dataEnd, skipFlag)):
+		if (rmIndex.find(rm, lodFlag)):
 			rm.seek(8, 1)
 			lodInfo.append(rm.readUByte())
 		rm.seek(0)
@@ -2415,7 +3451,7 @@ def meshWriteModel(mdl, outfile):
 	idxCounts = []
 	vertDefs = []
 	
-	while findFlag(rm, posFlag, rMesh.dataSize, skipFlag):
+	while rmIndex.find(rm, posFlag):
 		rm.seek(8,1)
 		vCounts.append((rm.readUShort(), rm.tell() - 2 + rMesh.offset))
 		rm.seek(8,1)
@@ -2435,59 +3471,20 @@ def meshWriteModel(mdl, outfile):
 			mesh.name = mesh.name.split('.')[0] 
 	
 	#merge Noesis-split meshes back together:	
-	meshesToExport = mdl.meshes
+	meshesToExport = [SubmeshArrays(mesh) for mesh in mdl.meshes]
 	if mdl.meshes[0].name.find("_") == 4:
 		print ("WARNING: Noesis-split meshes detected. Merging meshes back together...")
-		combinedMeshes = []
-		lastMesh = None
-		offset = 0
-		
-		for i, mesh in enumerate(mdl.meshes):
-			mesh.name = mesh.name[5:len(mesh.name)]
-			
-			if lastMesh == None:
-				lastMesh = copy.copy(mesh)
-				offset += len(mesh.positions)
-			elif mesh.name == lastMesh.name:
-				if len(lastMesh.positions) == len(mesh.positions) and len(lastMesh.indices) == len(mesh.indices): #ignore real duplicates
-					continue
-				newIndices = []
-				for j in range(len(mesh.indices)):
-					newIndices.append(mesh.indices[j]  + offset)
-				lastMesh.setPositions((lastMesh.positions + mesh.positions))
-				lastMesh.setUVs((lastMesh.uvs + mesh.uvs))
-				lastMesh.setUVs((lastMesh.lmUVs + mesh.lmUVs), 1)
-				lastMesh.setTangents((lastMesh.tangents + mesh.tangents))
-				lastMesh.setWeights((lastMesh.weights + mesh.weights))
-				lastMesh.setIndices((lastMesh.indices + tuple(newIndices)))
-				offset += len(mesh.positions)
-				
-			if i == len(mdl.meshes)-1:
-				if mesh.name == lastMesh.name:
-					combinedMeshes.append(lastMesh)
-				else:
-					combinedMeshes.append(mesh)
-			elif mdl.meshes[i+1].sourceName != mesh.sourceName:
-				combinedMeshes.append(lastMesh)
-				offset = 0
-				lastMesh = None	
-		meshesToExport = combinedMeshes
+		meshesToExport = mergeSplitMeshes(meshesToExport)
 	
 	#create list of objects to export:
 	submeshes = []
 	blankCounter = 0
 	doBlankMesh = False
+	submeshNames = indexSubmeshNames(meshesToExport)
 	for i in range(submeshCount):
-		bFound = False
-		for mesh in meshesToExport:
-			try:
-				if int(mesh.name.split('submesh')[1]) == i:
-					submeshes.append(mesh)
-					bFound = True
-					break
-			except:
-				pass
-		if bFound == False:
+		if (i, "base") in submeshNames:
+			submeshes.append(submeshNames[(i, "base")][0])
+		else:
 			print ("submesh" + str(i), "was not found in FBX and was omitted")
 			blankTangent = NoeMat43((NoeVec3((0,0,0)), NoeVec3((0,0,0)), NoeVec3((0,0,0)), NoeVec3((0,0,0)))) 
 			blankWeight = NoeVertWeight([0,0,0,0,0,0,0,0], [1,0,0,0,0,0,0,0])
@@ -2497,7 +3494,7 @@ def meshWriteModel(mdl, outfile):
 			blankMesh.setTangents([blankTangent, blankTangent, blankTangent]) #Normals + Tangents
 			if bRiggedModel:
 				blankMesh.setWeights([blankWeight,blankWeight,blankWeight]) #Weights + Indices
-			submeshes.append(blankMesh) #invisible placeholder submesh
+			submeshes.append(SubmeshArrays(blankMesh)) #invisible placeholder submesh
 			blankCounter += 1
 	if blankCounter == submeshCount:
 		doBlankMesh = True
@@ -2508,7 +3505,7 @@ def meshWriteModel(mdl, outfile):
 	if "teOffset" in names:
 		indOffFlag = buildFlagFromNames(["pe","GpuWrapApieIndexBufferChunkType"],nameToIndex,0)
 		for i in range(submeshCount):
-			if findFlag(rm, indOffFlag, rMesh.dataSize, skipFlag):
+			if rmIndex.find(rm, indOffFlag):
 				if readUShortAt(rm, rm.tell() + 10) < len(names) and names[readUShortAt(rm, rm.tell()+10)] == "teOffset":
 					indOffs.append((readUIntAt(rm, rm.tell()+18), rm.tell()+18+rMesh.offset))
 				elif i > 0:
@@ -2521,7 +3518,7 @@ def meshWriteModel(mdl, outfile):
 		
 	# Vertex component offsets
 	vCompOffs = []
-	while findFlag(rm, cmpOffFlag, rMesh.dataSize, skipFlag):
+	while rmIndex.find(rm, cmpOffFlag):
 		rm.seek(8, 1)
 		offC = rm.readInt()
 		offs = []
@@ -2530,7 +3527,7 @@ def meshWriteModel(mdl, outfile):
 		vCompOffs.append(offs)
 	rm.seek(0)
 	
-	if findFlag(rm, indexOfsFlag, rMesh.dataSize, skipFlag):
+	if rmIndex.find(rm, indexOfsFlag):
 		rm.seek(8,1)
 		idxOffset = (rm.readUInt(), rm.tell() - 4 + rMesh.offset)
 	else:
@@ -2542,7 +3539,7 @@ def meshWriteModel(mdl, outfile):
 	uvSeen = 0
 	vertDefs = []
 	extraDataIndexOffs = 0
-	while findFlag(rm, vDefFlag, rMesh.dataSize, skipFlag):
+	while rmIndex.find(rm, vDefFlag):
 		rm.seek(17,1)
 		compC = rm.readInt()
 		rm.seek(1, 1)
@@ -2594,37 +3591,55 @@ def meshWriteModel(mdl, outfile):
 	rm.seek(0)
 	
 	#Quantization info 
-	findFlag(rm, quantScaleFlag, rMesh.dataSize, skipFlag)
+	rmIndex.find(rm, quantScaleFlag)
 	quantOffs = rm.tell() + rMesh.offset
 	rm.seek(0)
 	
+	#vertex counts and indices are written as 16-bit values:
+	for i, mesh in enumerate(submeshes):
+		if mesh.vertexCount > 65535:
+			print ("Fatal Error: submesh" + str(i) + " has " + str(mesh.vertexCount) + " vertices, the limit per submesh is 65535. Split it into smaller submeshes")
+			return 0
+	
 	if doBlankMesh:
 		print ("Warning: Empty Mesh! Make sure your FBX submesh names are correct\n")
 		qScale = NoeVec4((1,1,1,0))
 		qOff = NoeVec4((0,0,0,1))
 	else:
 		#compute new quantization scale + offset
-		min = NoeVec3((10000000.0, 10000000.0, 10000000.0))
-		max = NoeVec3((-10000000.1, -10000000.1, -10000000.1))
-		for mesh in submeshes:
-			for v in mesh.positions:
-				if v[0] > max[0]: 
-					max[0] = v[0]
-				if v[0] < min[0]: 
-					min[0] = v[0]
-				if v[1] > max[1]: 
-					max[1] = v[1]
-				if v[1] < min[1]: 
-					min[1] = v[1]
-				if v[2] > max[2]: 
-					max[2] = v[2]
-				if v[2] < min[2]: 
-					min[2] = v[2]
+		if np is not None:
+			posArrays = [mesh.positions for mesh in submeshes]
+			min = NoeVec3(np.concatenate(posArrays + [[(10000000.0, 10000000.0, 10000000.0)]]).min(axis=0).tolist())
+			max = NoeVec3(np.concatenate(posArrays + [[(-10000000.1, -10000000.1, -10000000.1)]]).max(axis=0).tolist())
+		else:
+			min = NoeVec3((10000000.0, 10000000.0, 10000000.0))
+			max = NoeVec3((-10000000.1, -10000000.1, -10000000.1))
+			for mesh in submeshes:
+				for v in mesh.positions:
+					if v[0] > max[0]: 
+						max[0] = v[0]
+					if v[0] < min[0]: 
+						min[0] = v[0]
+					if v[1] > max[1]: 
+						max[1] = v[1]
+					if v[1] < min[1]: 
+						min[1] = v[1]
+					if v[2] > max[2]: 
+						max[2] = v[2]
+					if v[2] < min[2]: 
+						min[2] = v[2]
 		qScale = NoeVec4(((max[0] - min[0]) / 2, (max[1] - min[1]) / 2, (max[2] - min[2]) / 2, 0)) * (1 / meshScale)
 		qOff = NoeVec4(((max[0] + min[0]) / 2, (max[1] + min[1]) / 2, (max[2] + min[2]) / 2, 1)) * (1 / meshScale)
+	#a flat axis (every position equal on it) quantizes to 0 instead of dividing by a zero scale:
+	qDivisor = [qScale[k] if qScale[k] else 1.0 for k in range(3)]
 		
 	vDefInd = 0
 	
+	if bRiggedModel:
+		#index of each FBX bone in the mesh's boneNames, or -1:
+		meshBoneIndex = BoneIndex(boneNames)
+		boneRemap = [meshBoneIndex.find(bone.name) for bone in mdl.bones]
+	
 	if bExportAllBuffers and not bCompress:
 		copyBuffers(expOverMeshName, ext, readUIntAt(f, 104))
 	
@@ -2659,7 +3674,7 @@ def meshWriteModel(mdl, outfile):
 				nf.writeUInt(bs.tell())
 				if doGarmentMesh:
 					nf.seek(GMESHES[i].offset)
-					nf.writeUInt(len(submeshes[i].positions))
+					nf.writeUInt(submeshes[i].vertexCount)
 					
 				gs = NoeBitStream()
 				if doGarmentMesh2:
@@ -2671,107 +3686,155 @@ def meshWriteModel(mdl, outfile):
 					ms = NoeBitStream()
 					gfs = NoeBitStream()
 				
-				#print ("positions start", bs.tell(), "count", len(submeshes[i].positions))
-				for v, vert in enumerate(submeshes[i].positions):
-					startpos = bs.tell()
-					
-					valueA =  (int((vert[0] * (1 / meshScale) - qOff[0]) / qScale[0] * 32767.0))
-					valueB =  (int((vert[2] * (1 / meshScale) - qOff[2]) / qScale[2] * 32767.0))
-					valueC =  (int((vert[1] * (1 / meshScale) - qOff[1]) / qScale[1] * 32767.0))
-					bs.writeShort(-valueA)
-					bs.writeShort(valueB)
-					bs.writeShort(valueC)	
-					bs.writeShort(32767)
-					
+				#print ("positions start", bs.tell(), "count", submeshes[i].vertexCount)
+				positions = submeshes[i].positions
+				vertCount = len(positions)
+				doRegularWeights = bRiggedModel and (['PS_SkinIndices', 'PT_UByte4']) in vertDef
+				vertStride = posBStride if doRegularWeights else 8
+				
+				#whole submesh vertex stream, built at once when every value fits its field:
+				vertBuff = None
+				if not bRiggedModel or submeshes[i].boneIndices:
+					vertBuff = quantizePositions(positions, qDivisor, qOff, vertStride)
+				if vertBuff is not None and bRiggedModel and vertCount:
+					vertIndices, vertWeights = remapSkinInfluences(submeshes[i].boneIndices, submeshes[i].boneWeights, boneRemap)
+					if np is not None:
+						vertWeightBytes = np.trunc(vertWeights * 255.0)
+					else:
+						vertWeightBytes = [[int(weight * 255.0) for weight in row] for row in vertWeights]
+					bFits = True
+					if doRegularWeights:
+						bFits = skinRowsFit(vertIndices, skinBICount * 4) and skinRowsFit(vertWeightBytes, skinBWCount * 4)
+					if doGarmentMesh2:
+						#the garment streams only get zeroed records while skinWeights/skinWeightsExt are set
+						bExtended = GMESHES[i].skinWeightsExt != -1
+						bFits = bFits and GMESHES[i].skinWeights != -1 and (bExtended or GMESHES[i].skinIndicesExt == -1)
+						bFits = bFits and skinRowsFit(vertIndices, 8 if bExtended else None) and skinRowsFit(vertWeights, 8 if bExtended else None, False)
+					if not bFits:
+						vertBuff = None
+					else:
+						if doRegularWeights:
+							indexSize = skinBICount * 4
+							weightSize = skinBWCount * 4
+							weightsStart = 8 + indexSize
+							if np is not None:
+								vertWeightBytes = vertWeightBytes.astype(np.int64)
+							indexBytes = packSkinColumns(vertIndices, 0, indexSize, "B")
+							weightBytes = packSkinColumns(vertWeightBytes, 0, weightSize, "B")
+							for k in range(indexSize):
+								vertBuff[8+k::vertStride] = indexBytes[k::indexSize]
+							for k in range(weightSize):
+								vertBuff[weightsStart+k::vertStride] = weightBytes[k::weightSize]
+						if doGarmentMesh2:
+							gsSkinI1.writeBytes(packSkinColumns(vertIndices, 0, 4, "B"))
+							gsSkinW1.writeBytes(packSkinColumns(vertWeights, 0, 4, "f"))
+							if bExtended:
+								gsSkinI2.writeBytes(packSkinColumns(vertIndices, 4, 4, "B"))
+								gsSkinW2.writeBytes(packSkinColumns(vertWeights, 4, 4, "f"))
+				
+				if vertBuff is not None:
+					bs.writeBytes(vertBuff)
 					if doGarmentMesh or doGarmentMesh2:
-						gs.writeFloat(vert[0] * (1 / meshScale))
-						gs.writeFloat(vert[2] * (1 / meshScale))
-						gs.writeFloat(vert[1] * (1 / meshScale))
+						if np is not None:
+							gs.writeBytes((positions[:,(0,2,1)] * (1 / meshScale)).astype('<f4').tobytes())
+						else:
+							gPosList = []
+							for vert in positions:
+								gPosList.extend((vert[0] * (1 / meshScale), vert[2] * (1 / meshScale), vert[1] * (1 / meshScale)))
+							gs.writeBytes(struct.pack("<" + 'f'*len(gPosList), *gPosList))
 						if doGarmentMesh:
-							ms.writeFloat(0)
-							ms.writeFloat(0)
-							ms.writeFloat(0)
-							gfs.writeUShort(0)
-							
-					if bRiggedModel:
-					
-						doRegularWeights = True if (['PS_SkinIndices', 'PT_UByte4']) in vertDef else False
+							ms.writeBytes(bytes(12 * vertCount))
+							gfs.writeBytes(bytes(2 * vertCount))
+				else:
+					#out-of-range values, influences that overflow their record and submeshes without rigging are written per vertex, exactly as before:
+					for v, vert in enumerate(positions):
+						startpos = bs.tell()
 						
-						#write 00's
-						pos = bs.tell()
-						if doRegularWeights:
-							for k in range(skinBICount + skinBWCount):
-								bs.writeUInt(0)
-						bs.seek(pos)
-						if doGarmentMesh2:
-							if GMESHES[i].skinWeights != -1:
-								gsSkinI1.writeUInt(0)
-								gsSkinI1.seek(-4,1)
-								gsSkinW1.writeUInt64(0); gsSkinW1.writeUInt64(0)
-								gsSkinW1.seek(-16,1)
-							if GMESHES[i].skinWeightsExt != -1:
-								gsSkinI2.writeUInt(0)
-								gsSkinI2.seek(-4,1)
-								gsSkinW2.writeUInt64(0); gsSkinW2.writeUInt64(0)
-								gsSkinW2.seek(-16,1)
-							iEndPosOne = gsSkinI1.tell() + 4
-							iEndPosTwo = gsSkinI2.tell() + 4
-							wEndPosOne = gsSkinW1.tell() + 16
-							wEndPosTwo = gsSkinW2.tell() + 16
-							
-						#bone indices
-						lastGoodIdx = 0
-						try:
-							submeshes[i].weights[0].indices
-						except IndexError:
-							print ("Error: No rigging detected for submesh" + str(i))
-							break
+						valueA =  (int((vert[0] * (1 / meshScale) - qOff[0]) / qDivisor[0] * 32767.0))
+						valueB =  (int((vert[2] * (1 / meshScale) - qOff[2]) / qDivisor[2] * 32767.0))
+						valueC =  (int((vert[1] * (1 / meshScale) - qOff[1]) / qDivisor[1] * 32767.0))
+						bs.writeShort(-valueA)
+						bs.writeShort(valueB)
+						bs.writeShort(valueC)	
+						bs.writeShort(32767)
+						
+						if doGarmentMesh or doGarmentMesh2:
+							gs.writeFloat(vert[0] * (1 / meshScale))
+							gs.writeFloat(vert[2] * (1 / meshScale))
+							gs.writeFloat(vert[1] * (1 / meshScale))
+							if doGarmentMesh:
+								ms.writeBytes(bytes(12))
+								gfs.writeUShort(0)
+								
+						if bRiggedModel:
 							
-						for idx in range(len(submeshes[i].weights[v].indices)):
-							if (doGarmentMesh2 == True and GMESHES[i].skinIndicesExt != -1 and idx > 8) or (doGarmentMesh2 == False and idx > skinBWCount * 4): #prevent from going over
-								break
-							idxToWrite = lastGoodIdx
-							if mdl.bones[submeshes[i].weights[v].indices[idx]].name in boneNames:
-								idxToWrite = boneNames.index(mdl.bones[submeshes[i].weights[v].indices[idx]].name)
-								lastGoodIdx = idxToWrite
-							if doRegularWeights:	
-								bs.writeUByte(idxToWrite)
+							#write 00's
+							pos = bs.tell()
+							if doRegularWeights:
+								bs.writeBytes(bytes(4 * (skinBICount + skinBWCount)))
+							bs.seek(pos)
 							if doGarmentMesh2:
-								if idx < 4:
-									gsSkinI1.writeUByte(idxToWrite)
-								else:
-									gsSkinI2.writeUByte(idxToWrite)
-						if doRegularWeights:				
-							bs.seek(pos + (skinBICount * 4))
-						pos = bs.tell()
-						
-						#skin weights
-						for idx in range(len(submeshes[i].weights[v].weights)):
-							if (doGarmentMesh2 == True and GMESHES[i].skinWeightsExt != -1 and idx > 8) or (doGarmentMesh2 == False and idx > skinBWCount * 4):
+								if GMESHES[i].skinWeights != -1:
+									gsSkinI1.writeUInt(0)
+									gsSkinI1.seek(-4,1)
+									gsSkinW1.writeUInt64(0); gsSkinW1.writeUInt64(0)
+									gsSkinW1.seek(-16,1)
+								if GMESHES[i].skinWeightsExt != -1:
+									gsSkinI2.writeUInt(0)
+									gsSkinI2.seek(-4,1)
+									gsSkinW2.writeUInt64(0); gsSkinW2.writeUInt64(0)
+									gsSkinW2.seek(-16,1)
+								iEndPosOne = gsSkinI1.tell() + 4
+								iEndPosTwo = gsSkinI2.tell() + 4
+								wEndPosOne = gsSkinW1.tell() + 16
+								wEndPosTwo = gsSkinW2.tell() + 16
+								
+							#bone indices
+							if not submeshes[i].boneIndices:
+								print ("Error: No rigging detected for submesh" + str(i))
 								break
 								
-							if doRegularWeights:
-								bs.writeUByte(int(submeshes[i].weights[v].weights[idx] * 255.0))
+							lastGoodIdx = 0
+							for idx, boneIdx in enumerate(submeshes[i].boneIndices[v]):
+								if (doGarmentMesh2 == True and GMESHES[i].skinIndicesExt != -1 and idx > 8) or (doGarmentMesh2 == False and idx > skinBWCount * 4): #prevent from going over
+									break
+								if boneRemap[boneIdx] != -1:
+									lastGoodIdx = boneRemap[boneIdx]
+								if doRegularWeights:	
+									bs.writeUByte(lastGoodIdx)
+								if doGarmentMesh2:
+									if idx < 4:
+										gsSkinI1.writeUByte(lastGoodIdx)
+									else:
+										gsSkinI2.writeUByte(lastGoodIdx)
+							if doRegularWeights:				
+								bs.seek(pos + (skinBICount * 4))
 							
-							if doGarmentMesh2:
-								if idx < 4:
-									gsSkinW1.writeFloat(submeshes[i].weights[v].weights[idx])
+							#skin weights
+							for idx, weight in enumerate(submeshes[i].boneWeights[v]):
+								if (doGarmentMesh2 == True and GMESHES[i].skinWeightsExt != -1 and idx > 8) or (doGarmentMesh2 == False and idx > skinBWCount * 4):
+									break
+								if doRegularWeights:
+									bs.writeUByte(int(weight * 255.0))
+								if doGarmentMesh2:
+									if idx < 4:
+										gsSkinW1.writeFloat(weight)
+									else:
+										gsSkinW2.writeFloat(weight)
+										
+							if doGarmentMesh2:			
+								gsSkinI1.seek(iEndPosOne)
+								gsSkinI2.seek(iEndPosTwo)
+								gsSkinW1.seek(wEndPosOne)
+								gsSkinW2.seek(wEndPosTwo)
+						
+							if doRegularWeights:
+								#ExtraData is for morphOffsets, 4 half floats "X Y Z _"
+								if posBStride > bs.tell() - startpos:
+									bs.writeBytes(bytes(posBStride - (bs.tell() - startpos)))
 								else:
-									gsSkinW2.writeFloat(submeshes[i].weights[v].weights[idx])
-									
-						if doGarmentMesh2:			
-							gsSkinI1.seek(iEndPosOne)
-							gsSkinI2.seek(iEndPosTwo)
-							gsSkinW1.seek(wEndPosOne)
-							gsSkinW2.seek(wEndPosTwo)
+									bs.seek(startpos + posBStride)
 					
-						if doRegularWeights:
-							#ExtraData is for morphOffsets, 4 half floats "X Y Z _"
-							if posBStride > bs.tell() - startpos:
-								for k in range(posBStride - (bs.tell() - startpos)):
-									bs.writeUByte(0)
-							else:
-								bs.seek(startpos + posBStride)
 				if doGarmentMesh or doGarmentMesh2:
 					if not bCompress:
 						newgMeshVBuff = rapi.getOutputName().replace(".mesh", ".mesh." + str(GMESHES[i].vertices) + ".buffer")
@@ -2822,56 +3885,29 @@ def meshWriteModel(mdl, outfile):
 					nf.seek(vCompOff[1][1])
 					nf.writeUInt(bs.tell())
 						
-					for v, vert in enumerate(submeshes[i].uvs):
-						pos = bs.tell()
-						if bFlipImage:
-							bs.writeHalfFloat(vert[0])
-							bs.writeHalfFloat(1-vert[1])
-						else:
-							bs.writeHalfFloat(vert[0])
-							bs.writeHalfFloat(vert[1])
+					bs.writeBytes(packUVs(submeshes[i].uvs))
 					
 				elif uvAdded == 1: 
 					nf.seek(vCompOff[3][1])
 					nf.writeUInt(bs.tell())
 						
-					try:
-						submeshes[i].lmUVs[0][0]
-					except IndexError:
+					if not len(submeshes[i].lmUVs):
 						print ("UV2 not found, writing UV1 as UV2")
 						submeshes[i].lmUVs = submeshes[i].uvs
 						
-					for v, vert in enumerate(submeshes[i].lmUVs):
-						pos = bs.tell()
-						if bVertexColors:
-							try:
-								bs.writeUByte(int(submeshes[i].colors[v][0] * 255.0))
-								bs.writeUByte(int(submeshes[i].colors[v][1] * 255.0))
-								bs.writeUByte(int(submeshes[i].colors[v][2] * 255.0))
-								bs.writeUByte(int(submeshes[i].colors[v][3] * 255.0))
-							except IndexError:
-								bs.writeInt(0)
-						if bFlipImage:
-							bs.writeHalfFloat(vert[0])
-							bs.writeHalfFloat(1-vert[1])
-						else:
-							bs.writeHalfFloat(vert[0])
-							bs.writeHalfFloat(vert[1])
+					bs.writeBytes(packUVs(submeshes[i].lmUVs, submeshes[i].colors if bVertexColors else None))
 						
 				uvAdded = uvAdded + 1
 				
 			elif comp[0] == "PS_Normal":
 				nf.seek(vCompOff[2][1])
 				nf.writeUInt(bs.tell())
-				for v, nrm in enumerate(submeshes[i].tangents):
-					nX = int(-(nrm[0][0] * 512.0) + 511.0000001)
-					nY = int((nrm[0][2] * 512.0)  + 511.0000001) << 10
-					nZ = int((nrm[0][1] * 512.0)  + 511.0000001) << 20
-					bs.writeInt(1073741824 | nX | nY | nZ)
-					tX = int(-(nrm[2][0] * 512.0)  + 511.0000001)
-					tY = int((nrm[2][2] * 512.0) + 511.0000001) << 10
-					tZ = int((nrm[2][1] * 512.0)  + 511.0000001) << 20
-					bs.writeInt(0 | tX | tY | tZ)
+				packedNormals = pack101010(submeshes[i].normals, 1073741824)
+				packedTangents = pack101010(submeshes[i].tangents)
+				if np is not None:
+					bs.writeBytes(np.column_stack((packedNormals, packedTangents)).tobytes())
+				else:
+					bs.writeBytes(struct.pack("<" + 'i'*2*len(packedNormals), *[packed for pair in zip(packedNormals, packedTangents) for packed in pair]))
 						
 			elif comp[0] == "PS_VehicleDmgPosition":
 				nf.seek(vCompOff[4][1])
@@ -2879,21 +3915,26 @@ def meshWriteModel(mdl, outfile):
 				
 				theMesh = submeshes[i]
 				if bImportExportDamageMeshes:
-					for mesh in meshesToExport:
-						if mesh.name == "submesh" + str(i) + "_damageMesh" and len(mesh.positions) == len(submeshes[i].positions):
+					for mesh in submeshNames.get((i, "damageMesh"), []):
+						if mesh.vertexCount == submeshes[i].vertexCount:
 							print("Writing submesh" + str(i) + "_damageMesh")
 							theMesh = mesh
 							break
 				
-				for v in range(len(theMesh.positions)):
-					nX = int(-(theMesh.tangents[v][0][0] * 512.0) + 511.0000001)
-					nY = int((theMesh.tangents[v][0][2] * 512.0)  + 511.0000001) << 10
-					nZ = int((theMesh.tangents[v][0][1] * 512.0)  + 511.0000001) << 20
-					bs.writeInt(1073741824 | nX | nY | nZ)
-					bs.writeFloat(-theMesh.positions[v][0] * (1 / meshScale)  * (1 / 100))
-					bs.writeFloat(theMesh.positions[v][2] * (1 / meshScale)  * (1 / 100))
-					bs.writeFloat(theMesh.positions[v][1] * (1 / meshScale)  * (1 / 100))
-					bs.writeFloat(0)
+				dmgCount = theMesh.vertexCount
+				packedNormals = pack101010(theMesh.normals[:dmgCount], 1073741824)
+				if np is not None:
+					dmgArray = np.zeros(dmgCount, dtype=[('normal', '<i4'), ('position', '<f4', 4)])
+					dmgArray['normal'] = packedNormals
+					dmgArray['position'][:,0] = -theMesh.positions[:,0] * (1 / meshScale)  * (1 / 100)
+					dmgArray['position'][:,1] = theMesh.positions[:,2] * (1 / meshScale)  * (1 / 100)
+					dmgArray['position'][:,2] = theMesh.positions[:,1] * (1 / meshScale)  * (1 / 100)
+					bs.writeBytes(dmgArray.tobytes())
+				else:
+					dmgList = []
+					for vert in theMesh.positions:
+						dmgList.extend((-vert[0] * (1 / meshScale)  * (1 / 100), vert[2] * (1 / meshScale)  * (1 / 100), vert[1] * (1 / meshScale)  * (1 / 100), 0))
+					bs.writeBytes(b''.join(struct.pack("<iffff", packedNormals[v], *dmgList[v*4:v*4+4]) for v in range(dmgCount)))
 			else:
 				continue
 				
@@ -2918,20 +3959,17 @@ def meshWriteModel(mdl, outfile):
 			nf.seek(indOffs[i][1])
 			nf.writeUInt(bs.tell() - newIdxOffs)
 			
-		for v in range(0, len(mesh.indices), 3):
-			pos = bs.tell()
-			try:	#reverse winding order
-				bs.writeUShort(mesh.indices[v+2])
-				bs.writeUShort(mesh.indices[v+1])
-				bs.writeUShort(mesh.indices[v])
-					
-			except IndexError:
-				bs.seek(pos+6)	
+		try:
+			facesBuff = packReversedTriangles(mesh.indices)
+		except ValueError as e:
+			print ("Fatal Error: submesh" + str(i) + ":", e)
+			return 0
+		bs.writeBytes(facesBuff)
+		if len(mesh.indices) % 3:
+			bs.seek(6, 1) #an incomplete last triangle still takes up a triangle's space
 				
-			if doGarmentMesh or doGarmentMesh2:
-				gs.writeUShort(mesh.indices[v+2])
-				gs.writeUShort(mesh.indices[v+1])
-				gs.writeUShort(mesh.indices[v])
+		if doGarmentMesh or doGarmentMesh2:
+			gs.writeBytes(facesBuff)
 		
 		if doGarmentMesh or doGarmentMesh2:
 			if not bCompress:
@@ -2966,38 +4004,41 @@ def meshWriteModel(mdl, outfile):
 	nf.writeFloat(qOff[1])
 	
 	for i, mesh in enumerate(submeshes):
-		if len(mesh.positions) != vCounts[i][0]:
+		if mesh.vertexCount != vCounts[i][0]:
 			nf.seek(vCounts[i][1])
-			nf.writeUShort(len(mesh.positions))
+			nf.writeUShort(mesh.vertexCount)
 			
 		if len(mesh.indices) != idxCounts[i][0]:
 			nf.seek(idxCounts[i][1])
 			nf.writeUInt(len(mesh.indices))
 	
+	#index the properties of the output copy, which the patches below are written to:
+	nfIndex = CR2WPropertyIndex(nf, names, EXPORTS)
+	
 	#remove now-incorrect morphs from morphtarget:
 	if bIsMorphtarget:
 		targetsFlag = buildFlagFromNames(["targets", "array:MorphTargetMeshEntry"], nameToIndex, 0)
 		nf.seek(cMesh.offset)
-		if findFlag(nf, targetsFlag, cMesh.offset + cMesh.dataSize, 0):
+		if nfIndex.find(nf, targetsFlag):
 			nf.seek(8,1)
 			nf.writeUInt(0)
 		
 		nf.seek(cMesh.offset)
 		numTargetsFlag = buildFlagFromNames(["numTargets", "Uint32"], nameToIndex, 0)
-		if findFlag(nf, numTargetsFlag, cMesh.offset + cMesh.dataSize, targetsFlag):
+		if nfIndex.find(nf, numTargetsFlag):
 			nf.seek(8,1)
 			nf.writeUInt(0)
 			
 		nf.seek(cMesh.offset)	
 		morphsFlag = buildFlagFromNames(["targetTextureDiffsData", "array:rendRenderMorphTargetMeshBlobTextureData"], nameToIndex, 0)
-		if findFlag(nf, morphsFlag, cMesh.offset + cMesh.dataSize, targetsFlag):
+		if nfIndex.find(nf, morphsFlag):
 			nf.seek(8,1)
 			nf.writeUInt(0)
 			
 		if vFactory != -1:
 			vertFactoryFlag = buildFlagFromNames(["vertexFactory", "Uint8"], nameToIndex, 0)
 			nf.seek(rMesh.offset)
-			if findFlag(nf, vertFactoryFlag, cMesh.dataEnd, 0):
+			if nfIndex.find(nf, vertFactoryFlag):
 				nf.seek(8,1)
 				nf.writeUShort(vFactory)
 	
@@ -3005,7 +4046,7 @@ def meshWriteModel(mdl, outfile):
 	if bHighestLODOnly:
 		LODflag = buildFlagFromNames(["renderLODs" , "array:Float"], nameToIndex, 0)
 		nf.seek(rMesh.offset)
-		if findFlag(nf, LODflag, maxOffset, skipFlag):
+		if nfIndex.find(nf, LODflag):
 			nf.seek(8,1)
 			nf.writeUInt(1)
 			
@@ -3031,20 +4072,7 @@ def meshWriteModel(mdl, outfile):
 			outfile.writeBytes(nf.readBytes(buffers[0].offset)) #write meshfile part
 		
 		
-		for buff in buffers:
-			if buff.data.getSize() == 0:
-				f.seek(buff.origOffset)
-				buff.data.writeBytes(f.readBytes(buff.diskSize))
-			buff.offset = outfile.tell()
-			outfile.writeBytes(buff.data.getBuffer())
-			buff.diskSize = buff.data.getSize()
-		for buff in buffers:
-			outfile.seek(buff.bufferOffset + 8)
-			outfile.writeUInt(buff.offset)
-			outfile.writeUInt(buff.diskSize)
-			outfile.writeUInt(buff.memSize)
-		outfile.seek(28)
-		outfile.writeUInt(outfile.getSize()) #bufferSize
+		writeCR2WBuffers(outfile, f, buffers, getCompressionProfile())
 		#outfile.writeUInt(4476749) #MOD (CRC)
 	
 	return 1
\ No newline at end of file